@@ -1,22 +1,24 @@
 import os   # app.py
 import logging
+import time
 import schedule as s
+from datetime import datetime, timedelta, timezone
 
-from page_scraping import attempt_login, initialize_driver # tanya gemini bsk ini maksudnya paa apakah semuanya jadi ke run gt
 from dotenv import load_dotenv
 load_dotenv()
 #print(f"load_dotenv() executed. Found and loaded .env")
 
-from flask import Flask, request, abort
+from flask import Flask, request, abort, jsonify
 from cryptography.fernet import Fernet
 from ml_classifier import main
+import db
+import messaging
+import metrics
+import model_server
+import verification
+from event_queue import EventQueue
+from cache import TTLCache
 # from transformers import pipeline
-from supabase import create_client, Client
-
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
-#print("URL:", url[:10])
 
 from linebot.v3 import (
     WebhookParser
@@ -27,12 +29,10 @@ from linebot.v3.exceptions import (
 from linebot.v3.webhooks import (
     MessageEvent,
     TextMessageContent,
-    FollowEvent
+    FollowEvent,
+    UnfollowEvent
 )
 from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
     ReplyMessageRequest,
     TextMessage,
     PushMessageRequest
@@ -47,15 +47,59 @@ key: str = os.environ.get("FKEY")
 key_bytes = key.encode('utf-8')
 cypher = Fernet(key_bytes) 
 
-configuration = Configuration(access_token=os.getenv("CHANNEL_ACCESS_TOKEN"))
-api_client = ApiClient(configuration=configuration)
-line_bot_api = MessagingApi(api_client=api_client)
+# Outbound LINE calls go through messaging.py: one pooled client, replies sent on its pool
 parser = WebhookParser(channel_secret=os.getenv("CHANNEL_SECRET"))
 
+# When ASYNC_WEBHOOK is on, /callback only verifies and enqueues; workers do the slow part
+ASYNC_WEBHOOK = os.getenv("ASYNC_WEBHOOK", "0").lower() in ("1", "true", "yes")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 100))
+
+# LineIDs known to be in "Login data", so registered users skip the lookup on every message
+registered_users = TTLCache(
+    "registered_users",
+    maxsize=int(os.getenv("REGISTRATION_CACHE_SIZE", 10000)),
+    ttl=int(os.getenv("REGISTRATION_CACHE_TTL", 3600)),
+)
+
+# "Registration" rows of users part-way through registering. Off (0) by default: with several
+# web processes a user's next message may reach a process holding an older copy of the row
+REGISTRATION_STATE_TTL = int(os.getenv("REGISTRATION_STATE_TTL", 0))
+registrations = TTLCache(
+    "registrations",
+    maxsize=int(os.getenv("REGISTRATION_CACHE_SIZE", 10000)),
+    ttl=REGISTRATION_STATE_TTL,
+)
+
+# Users whose "Login data".LastActive was written recently; the adaptive scraper
+# schedule polls active users more often
+recently_active = TTLCache(
+    "recently_active",
+    maxsize=int(os.getenv("REGISTRATION_CACHE_SIZE", 10000)),
+    ttl=int(os.getenv("ACTIVE_TOUCH_INTERVAL", 600)),
+)
+
+# A portal check claimed in "Registration".VerifyingAt longer ago than this is taken to be lost
+VERIFY_CLAIM_TTL = int(os.getenv("VERIFY_CLAIM_TTL", 300))
+VERIFY_QUEUE_SIZE = int(os.getenv("VERIFY_QUEUE_SIZE", 50))
+
+# Load BART now (in the gunicorn master when preload_app is on) instead of on the first message
+if os.getenv("PRELOAD_MODEL", "0").lower() in ("1", "true", "yes"):
+    model_server.warm()
+
 @app.route("/")
 def index():
     return "LINE bot is running!"
 
+@app.route("/metrics")
+def metrics_endpoint():
+    return jsonify(metrics.snapshot())
+
+@app.route("/health")
+def health():
+    # Always 200 so the dyno is not restarted while the model is still loading
+    return jsonify({"status": "ok", "model": model_server.status()})
+
 @app.route("/callback", methods=['POST'])
 def callback():
     # Get X-Line-Signature header value for security purposes
@@ -78,33 +122,42 @@ def callback():
 
     # setelah textnya di process, set route replynya disini
     for event in events:
-        app.logger.info(f"Processing event type: {type(event)}")
-        if isinstance(event, MessageEvent): # A lot of different types of MessageEvent
-            if isinstance(event.message, TextMessageContent):
-                handle_text_message(event)
-            else:
-                print("It's not a TextMessageContent from user")
-        elif isinstance(event, FollowEvent):
-            # Bot has been added, asks for id and pass
-            handle_follow_event(event)
-        else:
-            print("Unhandled event)")
+        metrics.incr("webhook.events")
+        if ASYNC_WEBHOOK and event_queue.submit(event):
+            continue
+        # sync mode, or the queue is full: handle inline so the event is not lost
+        dispatch_event(event)
 
     return 'OK'
 
 
+def dispatch_event(event):
+    app.logger.info(f"Processing event type: {type(event)}")
+    if isinstance(event, MessageEvent): # A lot of different types of MessageEvent
+        if isinstance(event.message, TextMessageContent):
+            handle_text_message(event)
+        else:
+            print("It's not a TextMessageContent from user")
+    elif isinstance(event, FollowEvent):
+        # Bot has been added, asks for id and pass
+        handle_follow_event(event)
+    elif isinstance(event, UnfollowEvent):
+        # Bot has been blocked, stop trusting the cached registration
+        forget_user(event.source.user_id)
+    else:
+        print("Unhandled event)")
+
+
+event_queue = EventQueue(
+    dispatch_event, workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_SIZE, name="webhook"
+)
+
+
 # huggingface input and output in this function
 def handle_text_message(event: MessageEvent): 
     print("Received message:", event.message.text)
     
-    response = (
-        supabase.table("Login data")
-        .select("LineID")
-        .eq("LineID", event.source.user_id)
-        .execute()
-    )
-
-    if response.data:
+    if is_registered(event.source.user_id):
         input_text = event.message.text
         app.logger.info(f"Handling text message: '{input_text}' with token {event.reply_token[:10]}...")
 
@@ -114,7 +167,8 @@ def handle_text_message(event: MessageEvent):
             output_text = event.message.text.lower().replace("echo", "", 1).strip()
 
         else:
-            output_text = main(event.message.text, event.source.user_id)
+            with metrics.timer("stage.answer"):
+                output_text = main(event.message.text, event.source.user_id)
 
         # --- v3 Replying ---
         try:
@@ -124,16 +178,44 @@ def handle_text_message(event: MessageEvent):
                 messages = [TextMessage(text = output_text)] # Messages must be in a list
             )
 
-            # 2. Call the reply_message method with the request object
-            line_bot_api.reply_message(reply_request)
-            app.logger.info(f"Successfully replied: '{output_text}'")
+            # 2. Queue the reply so this worker does not wait on LINE; latency and
+            #    errors are recorded under line.reply_message
+            messaging.send_async("reply_message", reply_request)
+            app.logger.info(f"Queued reply: '{output_text}'")
 
         except Exception as e:
             # Log any errors during the reply process
             app.logger.error(f"Failed to send reply for token {event.reply_token[:10]}...: {e}")
+        touch_active(event.source.user_id)
     else:
         handle_new_user(event)
 
+def is_registered(user_id):
+    if registered_users.get(user_id):
+        return True
+    with metrics.timer("stage.user_lookup"):
+        row = db.get_login(user_id)
+    if row:
+        registered_users.set(user_id, True)
+        return True
+    # Unregistered users are not cached, registration may finish in another worker
+    return False
+
+def touch_active(user_id):
+    # At most one LastActive write per user every ACTIVE_TOUCH_INTERVAL seconds
+    if recently_active.get(user_id):
+        return
+    recently_active.set(user_id, True)
+    try:
+        db.update_login(user_id, {"LastActive": datetime.now(timezone.utc).isoformat()})
+    except Exception as e:
+        app.logger.warning(f"Could not update LastActive for {user_id}: {e}")
+
+def forget_user(user_id):
+    # Call whenever a user's "Login data" row is deleted
+    registered_users.invalidate(user_id)
+    app.logger.info(f"Forgot cached registration of {user_id}")
+
 def handle_follow_event(event: FollowEvent):
     userid = event.source.user_id
 
@@ -146,287 +228,211 @@ def handle_follow_event(event: FollowEvent):
         messages = [TextMessage(text = output_text)]
     )
 
-    line_bot_api.push_message(push_request)
-    app.logger.info(f"Successfully sent: '{output_text}'")
+    messaging.send_async("push_message", push_request)
+    app.logger.info(f"Queued push: '{output_text}'")
 
     
+# What differs between registering students and professors; both keep their progress in
+# one "Registration" row keyed by LineID
+ROLES = {
+    "student": {
+        "label": "Student",
+        "id_column": "StID",
+        "prompt": "Please state your portal id and password EACH IN ONE SEPARATE MESSAGE:) with the following format;\n\nstudent id: 1123xxx\npassword: 123xx",
+        "id_format": "'student id: 1123xxx'",
+        "done": "Registration complete. You can now use commands like 'assignments', 'activities' or 'echo'.",
+    },
+    "professor": {
+        "label": "Professor",
+        "id_column": "PrID",
+        "prompt": "Please state your portal id and password each in one separate message with the following format;\n\nprofessor id: 1123xxx\npassword: 123xx",
+        "id_format": "'professor id: 1123xxx'",
+        "done": "Registration complete. You can now inquire about your assignments, activities, or test with ''!",
+    },
+}
+
+def load_registration(user_id):
+    # One read per message, or none while the row is cached
+    if REGISTRATION_STATE_TTL:
+        state = registrations.get(user_id)
+        if state is not None:
+            return dict(state)
+    with metrics.timer("stage.registration_lookup"):
+        state = db.get_registration(user_id)
+    if state and REGISTRATION_STATE_TTL:
+        registrations.set(user_id, dict(state))
+    return state
+
+def save_registration(state):
+    with metrics.timer("stage.registration_save"):
+        db.save_registration(state)
+    if REGISTRATION_STATE_TTL:
+        registrations.set(state["LineID"], dict(state))
+
+def finish_registration(user_id):
+    registrations.invalidate(user_id)
+    db.delete_registration(user_id)
+
 def handle_new_user(event):
+    user_id = event.source.user_id
+    state = load_registration(user_id)
+    if state:
+        handle_registration(event, state)
+        return
+
     text = event.message.text.lower()
-    response1 = (
-        supabase.table("temp student login data")
-        .select("LineID")
-        .eq("LineID", event.source.user_id)
-        .execute()
-    )
+    if "student" in text:
+        save_registration({"LineID": user_id, "Role": "student", "PortalID": None, "Ps": None})
+        output_text = ROLES["student"]["prompt"]
+        verification.warm()
+    elif "professor" in text:
+        save_registration({"LineID": user_id, "Role": "professor", "PortalID": None, "Ps": None})
+        output_text = ROLES["professor"]["prompt"]
+        verification.warm()
+    else:
+        output_text = "Text not recognized.\nPlease state whether you are a \"Student\" or \"Professor\"."
 
-    response2 = (
-        supabase.table("temp professor login data")
-        .select("LineID")
-        .eq("LineID", event.source.user_id)
-        .execute()
+    reply_request = ReplyMessageRequest(
+        reply_token = event.reply_token,     
+        messages = [TextMessage(text = output_text)] # Messages must be in a list
     )
+    messaging.send_async("reply_message", reply_request)
+    app.logger.info(f"Queued reply: '{output_text}'")
 
-    if response1.data:
-        handle_new_user_student(event)
-    elif response2.data:
-        handle_new_user_professor(event)
-    else: 
-        if "student" in text:
-            response = (
-                supabase.table("temp student login data")
-                .insert({"LineID": event.source.user_id})
-                .execute()
-            )
-            output_text = "Please state your portal id and password EACH IN ONE SEPARATE MESSAGE:) with the following format;\n\nstudent id: 1123xxx\npassword: 123xx"
-
-        elif "professor" in text:
-            response = (
-                supabase.table("temp professor login data")
-                .insert({"LineID": event.source.user_id})
-                .execute()
-            )
-            output_text = output_text = "Please state your portal id and password each in one separate message with the following format;\n\nprofessor id: 1123xxx\npassword: 123xx"
-
-        else:
-            output_text = "Text not recognized.\nPlease state whether you are a \"Student\" or \"Professor\"."
-        
-        reply_request = ReplyMessageRequest(
-            reply_token = event.reply_token,     
-            messages = [TextMessage(text = output_text)] # Messages must be in a list
-        )
-        line_bot_api.reply_message(reply_request)
-        app.logger.info(f"Successfully replied: '{output_text}'")
-
-def handle_new_user_professor(event):
+def handle_registration(event, state):
+    # state is the user's "Registration" row; it is written back at most once
     user_id = event.source.user_id
     text = event.message.text 
-
-    response = (
-        supabase.table("temp professor login data")
-        .select("PrID", "Ps")
-        .eq("LineID", str(user_id))
-        .execute()
-    )
-    tempid =  response.data[0].get("PrID") 
-    tempps =  response.data[0].get("Ps") 
+    role = ROLES[state["Role"]]
+    changed = False
 
     output_text = "Sorry, I didn't understand. Please enter with the correct format"
 
-    if tempid is None and ("professor" in text or "id" in text):
-        portalid = getpid(text)
+    if state["PortalID"] is None and (state["Role"] in text or "id" in text):
+        portalid = getid(text) if state["Role"] == "student" else getpid(text)
         if portalid:
-            response = (
-                supabase.table("temp professor login data")
-                .update({"PrID": portalid})
-                .eq("LineID", user_id)
-                .execute()
-            )
-            output_text = f"Professor ID received.\n({portalid})"
+            state["PortalID"] = portalid
+            changed = True
+            output_text = f"{role['label']} ID received.\n({portalid})"
         else:
-            output_text = "Could not extract ID. Please use the format: 'professor id: 1123xxx'"
+            output_text = f"Could not extract ID. Please use the format: {role['id_format']}"
 
-    if tempps is None and ("pass" in text or "password" in text):
+    if state["Ps"] is None and ("pass" in text or "password" in text):
         portalpass = getpass(text)
-        #app.logger.info(f"portalpass adalah: {portalpass}")
         if portalpass:
-            response = (
-                supabase.table("temp professor login data")
-                .update({"Ps": portalpass})
-                .eq("LineID", user_id)
-                .execute()
-            )
+            state["Ps"] = portalpass
+            changed = True
             output_text = f"Password received.\n({portalpass})"
-            #app.logger.info(f"portalpass adalah: {newusers[user_id]["pass"]}")
         else:
             output_text = "Could not extract password. Try: 'password: abc123'"
 
-    #   refresh with new data
-    response = (
-        supabase.table("temp professor login data")
-        .select("PrID", "Ps")
-        .eq("LineID", str(user_id))
-        .execute()
-    )
-    tempid =  response.data[0].get("PrID") 
-    tempps =  response.data[0] .get("Ps") 
-
     # after both are collected
-    if tempid and tempps:
-        app.logger.info(f"User {user_id} registering with ID: {tempid}")
-        driver = initialize_driver()
-        if attempt_login(driver, tempid, tempps) == True:
-            
-            encpass = enkrip(tempps)
-            try:
-                datatobeinserted = {
-                    "LineID": user_id,
-                    "PrID": tempid,
-                    "Ps": encpass
-                }
-
-                response = (
-                    supabase.table("Login data")
-                    .insert(datatobeinserted)
-                    .execute()
-                )
-
-                if response.data:
-                    print(f"Successfully inserted data into supa: {response}")
-                else:
-                    print("Insert failed.")
-                    if hasattr(response, 'error') and response.error:
-                        print(f"Error details: {response.error.message}")
-
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                if hasattr(e, 'json') and callable(e.json):
-                    try:
-                        print(f"APIError details: {e.json()}")
-                    except:
-                        pass
-
-            response = (
-                supabase.table("temp professor login data")
-                .delete()
-                .eq("LineID", user_id)
-                .execute()
-            )   
-            output_text = f"Registration complete. You can now inquire about your assignments, activities, or test with ''!"
-        else:
-            response = (
-                supabase.table("temp professor login data")
-                .update({"Ps": None, "PrID": None})
-                .eq("LineID", user_id)
-                .execute()
-            )
-            output_text = "Failed to login with current StudentID and Password.\nPlease recheck and try again."
+    if state["PortalID"] and state["Ps"]:
+        if changed:
+            save_registration(state)
+        output_text = start_verification(user_id, state)
+    elif changed:
+        save_registration(state)
 
     # Reply
     reply_request = ReplyMessageRequest(
         reply_token = event.reply_token,
         messages = [TextMessage(text = output_text)]
     )
-    line_bot_api.reply_message(reply_request)
-
+    messaging.send_async("reply_message", reply_request)
 
-def handle_new_user_student(event):
-    user_id = event.source.user_id
-    text = event.message.text 
-
-    #fetching past data
-    response = (
-        supabase.table("temp student login data")
-        .select("StID", "Ps")
-        .eq("LineID", str(user_id))
-        .execute()
-    )
-    tempid =  response.data[0].get("StID") 
-    tempps =  response.data[0].get("Ps") 
+def claim_verification(user_id):
+    # Claimed in the database, so a second message to another worker does not log in again
+    now = datetime.now(timezone.utc)
+    try:
+        return db.claim_verification(
+            user_id,
+            now.isoformat(),
+            (now - timedelta(seconds=VERIFY_CLAIM_TTL)).isoformat(),
+        )
+    except Exception as e:
+        app.logger.warning(f"Could not claim verification for {user_id}, checking anyway: {e}")
+        return True
 
-    #user_data = newusers[user_id]
+def release_verification(user_id):
+    try:
+        db.release_verification(user_id)
+    except Exception as e:
+        app.logger.warning(f"Could not release verification for {user_id}: {e}")
+
+def start_verification(user_id, state):
+    # The portal login runs on verification_queue; the result is pushed when it is done
+    if not claim_verification(user_id):
+        return "Still checking your ID and password, please wait a moment."
+    if verification_queue.submit((user_id, dict(state), time.perf_counter())):
+        return "Checking your ID and password with the portal...\nI will message you when it is done."
+    # Queue full: verify inline so the registration is not lost
+    try:
+        return verify_registration(user_id, state)
+    finally:
+        release_verification(user_id)
 
-    output_text = "Sorry, I didn't understand. Please enter with the correct format"
+def complete_registration(job):
+    user_id, state, submitted_at = job
+    try:
+        output_text = verify_registration(user_id, state)
+    except Exception as e:
+        app.logger.error(f"Verification failed for {user_id}: {e}")
+        output_text = "Could not check your ID and password right now.\nPlease send any message to try again."
+    finally:
+        release_verification(user_id)
+    metrics.observe("registration.verify_total_time", time.perf_counter() - submitted_at)
 
-    if tempid is None and ("student" in text or "id" in text):
-        portalid = getid(text)
-        if portalid:
-            #newusers[user_id]["id"] = f"s{portalid}"
-            response = (
-                supabase.table("temp student login data")
-                .update({"StID": portalid})
-                .eq("LineID", user_id)
-                .execute()
-            )
-            output_text = f"Student ID received.\n({portalid})"
-        else:
-            output_text = "Could not extract ID. Please use the format: 'student id: 1123xxx'"
+    push_request = PushMessageRequest(
+        to = user_id,
+        messages = [TextMessage(text = output_text)]
+    )
+    messaging.send_async("push_message", push_request)
 
-    if tempps is None and ("pass" in text or "password" in text):
-        portalpass = getpass(text)
-        #app.logger.info(f"portalpass adalah: {portalpass}")
-        if portalpass:
-            #newusers[user_id]["pass"] = portalpass
-            
-            response = (
-                supabase.table("temp student login data")
-                .update({"Ps": portalpass})
-                .eq("LineID", user_id)
-                .execute()
-            )
-            output_text = f"Password received.\n({portalpass})"
-            #app.logger.info(f"portalpass adalah: {newusers[user_id]["pass"]}")
-        else:
-            output_text = "Could not extract password. Try: 'password: abc123'"
+def verify_registration(user_id, state):
+    # Log in to the portal with the collected credentials; returns the reply text
+    role = ROLES[state["Role"]]
+    app.logger.info(f"User {user_id} registering with ID: {state['PortalID']}")
+    if verification.check_credentials(state["PortalID"], state["Ps"]):
+        
+        encpass = enkrip(state["Ps"])
+        try:
+            datatobeinserted = {
+                "LineID": user_id,
+                role["id_column"]: state["PortalID"],
+                "Ps": encpass
+            }
 
-    #   refresh with new data
-    response = (
-        supabase.table("temp student login data")
-        .select("StID", "Ps")
-        .eq("LineID", str(user_id))
-        .execute()
-    )
-    tempid =  response.data[0].get("StID") 
-    tempps =  response.data[0] .get("Ps") 
+            inserted = db.insert_login(datatobeinserted)
 
-    # after both are collected
-    if tempid and tempps:
-        app.logger.info(f"User {user_id} registering with ID: {tempid}")
-        driver = initialize_driver()
-        if attempt_login(driver, tempid, tempps) == True:
-            
-            encpass = enkrip(tempps)
-            try:
-                datatobeinserted = {
-                    "LineID": user_id,
-                    "StID": tempid,
-                    "Ps": encpass
-                }
-
-                response = (
-                    supabase.table("Login data")
-                    .insert(datatobeinserted)
-                    .execute()
-                )
-
-                if response.data:
-                    print(f"Successfully inserted data into supa: {response}")
-                else:
-                    print("Insert failed.")
-                    if hasattr(response, 'error') and response.error:
-                        print(f"Error details: {response.error.message}")
-
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                if hasattr(e, 'json') and callable(e.json):
-                    try:
-                        print(f"APIError details: {e.json()}")
-                    except:
-                        pass
-
-            #response = f"Registration complete. You can now use commands like 'assignments', 'activities' or 'echo'."
-            #del newusers[user_id]
-            response = (
-                supabase.table("temp student login data")
-                .delete()
-                .eq("LineID", user_id)
-                .execute()
-            )   
-            output_text = f"Registration complete. You can now use commands like 'assignments', 'activities' or 'echo'."
-        else:
-            response = (
-                supabase.table("temp student login data")
-                .update({"Ps": None, "StID": None})
-                .eq("LineID", user_id)
-                .execute()
-            )
-            output_text = "Failed to login with current StudentID and Password.\nPlease recheck and try again."
+            if inserted:
+                print(f"Successfully inserted data into supa: {inserted}")
+                registered_users.set(user_id, True)
+            else:
+                print("Insert failed.")
 
-    # Reply
-    reply_request = ReplyMessageRequest(
-        reply_token = event.reply_token,
-        messages = [TextMessage(text = output_text)]
-    )
-    line_bot_api.reply_message(reply_request)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            if hasattr(e, 'json') and callable(e.json):
+                try:
+                    print(f"APIError details: {e.json()}")
+                except:
+                    pass
+
+        finish_registration(user_id)
+        return role["done"]
+
+    state["PortalID"] = None
+    state["Ps"] = None
+    save_registration(state)
+    return "Failed to login with current StudentID and Password.\nPlease recheck and try again."
+
+verification_queue = EventQueue(
+    complete_registration,
+    workers=verification.VERIFY_WORKERS,
+    maxsize=VERIFY_QUEUE_SIZE,
+    name="verification",
+)
 
 def getpid(string):
     prid = ""
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+import metrics
+from page_scraping import (
+    check_unchanged,
+    cycle_summary,
+    decrypt_password,
+    forget_session,
+    fresh_login_done,
+    load_session,
+    log_timings,
+    parse_activities_html,
+    parse_assignments_html,
+    record_scrape,
+    save_session,
+    session_resumed,
+    store_student,
+)
+from portal_http import AsyncPortalSession
+
+# Students scraped at the same time; also the size of the shared connection pool
+CONCURRENCY = int(os.environ.get("SCRAPE_CONCURRENCY", 10))
+# Scraped students waiting for the database writer before scrapers are held back
+WRITE_QUEUE_SIZE = int(os.environ.get("SCRAPE_WRITE_QUEUE_SIZE", 100))
+
+
+async def login_student_async(session, student, password, max_attempts=3):
+    """Async twin of page_scraping.login_student: resume the saved session or log in."""
+    lineid = student["LineID"]
+    username = student["StID"]
+    cookies = load_session(student)
+    if cookies:
+        start = time.perf_counter()
+        if await session.resume(cookies):
+            logging.info(f"Resumed portal session for {username}.")
+            session_resumed(lineid, time.perf_counter() - start)
+            return True
+        logging.info(f"Saved session for {username} expired, logging in again.")
+        metrics.incr("scrape.session_expired")
+    for attempt in range(max_attempts):
+        start = time.perf_counter()
+        if await session.login(username, password):
+            fresh_login_done(time.perf_counter() - start)
+            await asyncio.to_thread(save_session, lineid, session.cookies())
+            return True
+        logging.warning(f"Retrying login for {username}...")
+    logging.warning(f"All login attempts failed for {username}.")
+    return False
+
+
+async def scrape_student_async(transport, student, semaphore, write_queue, max_attempts=3):
+    """
+    Log in and fetch both pages for one student, then hand the results to the writer stage
+    unless they match the stored content hash.
+    Returns "changed", "unchanged" or "failed".
+    """
+    lineid = student["LineID"]
+    username = student["StID"]
+    async with semaphore:
+        password = decrypt_password(student)
+        session = AsyncPortalSession(transport)
+        if not await login_student_async(session, student, password, max_attempts):
+            return "failed"
+        assignments = activities = None
+        try:
+            assignments = parse_assignments_html(await session.assignments_html())
+            activities = parse_activities_html(await session.activities_html())
+        except Exception as e:
+            logging.warning(f"Failed to scrape {username}: {e}")
+        # The session is not closed: that would close the transport shared with other students
+    if assignments is None and activities is None:
+        forget_session(lineid)
+        return "failed"
+    digest, unchanged = check_unchanged(student, assignments, activities)
+    if unchanged:
+        logging.info(f"No changes for {username}, skipping writes.")
+        metrics.incr("scrape.unchanged")
+        await asyncio.to_thread(record_scrape, lineid)
+        return "unchanged"
+    metrics.incr("scrape.changed")
+    await write_queue.put((lineid, username, assignments, activities, digest))
+    return "changed"
+
+
+async def writer(write_queue):
+    """
+    Database stage: Supabase calls are blocking, so they run in a thread while the scrapers
+    keep fetching pages.
+    """
+    while True:
+        item = await write_queue.get()
+        try:
+            if item is None:
+                return
+            await asyncio.to_thread(store_student, *item)
+        except Exception as e:
+            logging.error(f"Failed to write scraped rows: {e}")
+        finally:
+            write_queue.task_done()
+
+
+async def run_cycle_async(students, concurrency=CONCURRENCY):
+    """
+    Scrape every student over one pooled keep-alive connection pool, with at most
+    `concurrency` students in flight and database writes done by a separate consumer.
+    """
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=concurrency, max_keepalive_connections=concurrency
+        ),
+        retries=1,
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+    writer_task = asyncio.create_task(writer(write_queue))
+    timings = []  # (student id, seconds, status)
+
+    async def timed(student):
+        start = time.perf_counter()
+        try:
+            status = await scrape_student_async(transport, student, semaphore, write_queue)
+        except Exception as e:
+            logging.error(f"Failed to scrape {student.get('StID')}: {e}")
+            status = "failed"
+        elapsed = time.perf_counter() - start
+        metrics.observe("scrape.student_time", elapsed)
+        timings.append((student.get("StID"), elapsed, status))
+
+    logging.info(f"Scraping {len(students)} students, {concurrency} at a time (async)...")
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(timed(student) for student in students))
+        await write_queue.put(None)
+        await writer_task
+    finally:
+        await transport.aclose()
+    duration = time.perf_counter() - start
+    metrics.observe("scrape.cycle_time", duration)
+
+    summary = cycle_summary(duration, concurrency, students, timings)
+    logging.info(
+        f"Async scrape cycle finished in {duration:.1f}s: "
+        f"{summary['succeeded']} succeeded ({summary['unchanged']} unchanged), "
+        f"{summary['failed']} failed"
+    )
+    log_timings(timings)
+    return summary
@@ -0,0 +1,107 @@
+import argparse
+import gc
+import logging
+import os
+import statistics
+import time
+
+import psutil
+
+from finetune_bart import finetune_data
+from model_server import BACKENDS, MODEL_NAME, load_pipeline
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def rss_mb():
+    return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_backend(backend, model_name, prompts, num_beams, max_length):
+    """
+    Load one backend and generate every prompt once.
+    Returns (outputs, stats) where stats has load time, memory growth and latency figures.
+    """
+    gc.collect()
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    generator = load_pipeline(backend, model_name)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = rss_mb()
+
+    # One warm-up call so lazy initialisation is not counted as latency
+    generator(prompts[0], max_length=max_length, num_beams=num_beams)
+
+    outputs, latencies = [], []
+    for prompt in prompts:
+        start = time.perf_counter()
+        result = generator(prompt, max_length=max_length, num_beams=num_beams)
+        latencies.append(time.perf_counter() - start)
+        outputs.append(result[0]["generated_text"])
+    rss_after = rss_mb()
+
+    del generator
+    gc.collect()
+    return outputs, {
+        "load_s": load_seconds,
+        "model_mb": rss_loaded - rss_before,
+        "peak_mb": rss_after - rss_before,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare generation backends on the finetune_data prompts."
+    )
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--limit", type=int, default=0, help="only use the first N prompts")
+    parser.add_argument("--num-beams", type=int, default=5)
+    parser.add_argument("--max-length", type=int, default=200)
+    args = parser.parse_args()
+
+    prompts = [d["input"] for d in finetune_data]
+    if args.limit:
+        prompts = prompts[: args.limit]
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+
+    results = {}
+    for backend in backends:
+        logging.info(f"Benchmarking {backend} on {len(prompts)} prompts...")
+        try:
+            results[backend] = run_backend(
+                backend, args.model, prompts, args.num_beams, args.max_length
+            )
+        except Exception as e:
+            logging.error(f"Backend {backend} failed: {e}")
+
+    # Agreement is measured against the full-precision transformers outputs
+    reference = results.get("transformers", (None,))[0]
+    print(
+        f"{'backend':<13}{'load s':>8}{'model MB':>10}{'peak MB':>9}"
+        f"{'mean ms':>9}{'p50 ms':>8}{'p95 ms':>8}{'agree':>8}"
+    )
+    for backend, (outputs, stats) in results.items():
+        agreement = (
+            f"{sum(a == b for a, b in zip(outputs, reference)) / len(outputs):.0%}"
+            if reference
+            else "n/a"
+        )
+        print(
+            f"{backend:<13}{stats['load_s']:>8.1f}{stats['model_mb']:>10.0f}"
+            f"{stats['peak_mb']:>9.0f}{stats['mean_ms']:>9.0f}{stats['p50_ms']:>8.0f}"
+            f"{stats['p95_ms']:>8.0f}{agreement:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
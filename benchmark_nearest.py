@@ -0,0 +1,131 @@
+import argparse
+import logging
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import db
+from ml_classifier import build_items, fetch_rows, parse_date, table_fields
+from portal_dates import date_fields
+
+# Compares the old nearest_* path (fetch every future row, parse and sort in Python) with
+# the pushed-down query (order + limit 1) that reads the precomputed date columns, at a few
+# hundred rows per user.
+#   python benchmark_nearest.py --rows 300           # seeds rows for a throwaway LineID
+#   python benchmark_nearest.py --rows 300 --offline # Python-side cost only, no Supabase
+
+TZ = timezone(timedelta(hours=8))
+WEEKDAYS_ZH = "一二三四五六日"
+
+
+def synthetic_rows(line_id, count):
+    now = datetime.now(TZ).replace(second=0, microsecond=0)
+    assignments, activities = [], []
+    for i in range(count):
+        # Spread out so the earliest row is not the first one inserted
+        end = now + timedelta(hours=(i * 37) % (count * 2) + 1)
+        assignment_date = f"{now:%Y/%m/%d %H:%M} ~ {end:%Y/%m/%d %H:%M}"
+        assignments.append(
+            {
+                "LineID": line_id,
+                "UserID": line_id,
+                "AssignmentName": f"【作業】[演算法概論IN208] Benchmark {i}",
+                "AssignmentDate": assignment_date,
+                **date_fields(assignment_date, "assignment"),
+            }
+        )
+        label = f"{end:%Y.%m.%d}({WEEKDAYS_ZH[end.weekday()]})"
+        start_hour = end.hour - 2 if end.hour >= 2 else end.hour
+        activity_date = (
+            f"{label} {'下午' if start_hour >= 12 else '上午'} "
+            f"{(start_hour - 1) % 12 + 1:02d}:00 ~ "
+            f"{label} {'下午' if end.hour >= 12 else '上午'} "
+            f"{(end.hour - 1) % 12 + 1:02d}:00"
+        )
+        activities.append(
+            {
+                "LineID": line_id,
+                "UserID": line_id,
+                "ActivityName": f"Benchmark activity {i}",
+                "ActivityDate": activity_date,
+                **date_fields(activity_date, "activity"),
+            }
+        )
+    return {db.ASSIGNMENTS: assignments, db.ACTIVITIES: activities}
+
+
+def legacy_nearest(rows, classification):
+    """The nearest_* handling before the query was pushed down: parse everything, sort, keep one."""
+    _, name_field, date_field = table_fields(classification)
+    items = [
+        {"name": row[name_field], "date_info": parse_date(row[date_field], classification)}
+        for row in rows
+    ]
+    time_key = "time" if classification == "nearest_assignments" else "start_time"
+    items.sort(
+        key=lambda x: datetime.strptime(
+            f"{x['date_info']['date']} {x['date_info'][time_key]}", "%Y-%m-%d %H:%M"
+        )
+    )
+    return items[:1]
+
+
+def timed(fn, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.mean(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark nearest_* queries.")
+    parser.add_argument("--rows", type=int, default=300, help="future rows per table")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--line-id", default="benchmark-nearest")
+    parser.add_argument("--offline", action="store_true", help="skip Supabase")
+    args = parser.parse_args()
+
+    tables = synthetic_rows(args.line_id, args.rows)
+    if not args.offline:
+        for table_name, rows in tables.items():
+            for i in range(0, len(rows), 100):
+                db.insert_rows(table_name, rows[i : i + 100])
+
+    print(f"{'query':<20}{'old ms':>10}{'new ms':>10}{'old rows':>10}{'new rows':>10}")
+    try:
+        for classification in ("nearest_assignments", "nearest_activities"):
+            table_name, _, _ = table_fields(classification)
+            # The old path fetched the same rows as the plain listing query
+            listing = "assignments" if classification == "nearest_assignments" else "activities"
+            if args.offline:
+                all_rows = tables[table_name]
+                order = "end_datetime" if listing == "assignments" else "start_datetime"
+                new_rows = [min(all_rows, key=lambda row: row[order])]
+                old_ms = timed(lambda: legacy_nearest(all_rows, classification), args.runs)
+                new_ms = timed(lambda: build_items(new_rows, classification), args.runs)
+            else:
+                all_rows = fetch_rows(args.line_id, listing)
+                new_rows = fetch_rows(args.line_id, classification)
+                old_ms = timed(
+                    lambda: legacy_nearest(fetch_rows(args.line_id, listing), classification),
+                    args.runs,
+                )
+                new_ms = timed(
+                    lambda: build_items(fetch_rows(args.line_id, classification), classification),
+                    args.runs,
+                )
+            print(
+                f"{classification:<20}{old_ms:>10.1f}{new_ms:>10.1f}"
+                f"{len(all_rows or []):>10}{len(new_rows or []):>10}"
+            )
+    finally:
+        if not args.offline:
+            for table_name in tables:
+                db.delete_line_id(table_name, args.line_id)
+            logging.info(f"Removed benchmark rows for {args.line_id}")
+
+
+if __name__ == "__main__":
+    main()
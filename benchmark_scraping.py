@@ -0,0 +1,93 @@
+import argparse
+import logging
+import os
+import statistics
+import time
+
+import psutil
+
+from page_scraping import (
+    BACKENDS,
+    create_backend,
+    parse_activities_html,
+    parse_assignments_html,
+)
+
+# Compares the Selenium and HTTP scraper backends without writing to Supabase, e.g.
+#   python portal_fixture_server.py &
+#   PORTAL_BASE_URL=http://127.0.0.1:8765/PortalSocialVB/ python benchmark_scraping.py
+
+
+def tree_rss_mb():
+    # Includes browser and driver child processes started by Selenium
+    process = psutil.Process(os.getpid())
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss / (1024 * 1024)
+
+
+def run_backend(name, username, password, runs):
+    rss_before = tree_rss_mb()
+    start = time.perf_counter()
+    backend = create_backend(name)
+    startup = time.perf_counter() - start
+    peak_mb = tree_rss_mb() - rss_before
+    timings = {"login": [], "assignments": [], "activities": []}
+    counts = None
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            if not backend.login(username, password):
+                raise Exception("login failed")
+            timings["login"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            assignments = parse_assignments_html(backend.assignments_html())
+            timings["assignments"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            activities = parse_activities_html(backend.activities_html())
+            timings["activities"].append(time.perf_counter() - start)
+
+            counts = (len(assignments or []), len(activities or []))
+            peak_mb = max(peak_mb, tree_rss_mb() - rss_before)
+    finally:
+        backend.close()
+    return startup, peak_mb, timings, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper backends.")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--user", default="s1234567")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'backend':<10}{'start s':>9}{'memory MB':>11}{'login ms':>10}"
+        f"{'assign ms':>11}{'activ ms':>10}{'rows':>8}"
+    )
+    for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        try:
+            startup, peak_mb, timings, counts = run_backend(
+                name, args.user, args.password, args.runs
+            )
+        except Exception as e:
+            logging.error(f"Backend {name} failed: {e}")
+            continue
+        print(
+            f"{name:<10}{startup:>9.1f}{peak_mb:>11.0f}"
+            f"{statistics.mean(timings['login']) * 1000:>10.0f}"
+            f"{statistics.mean(timings['assignments']) * 1000:>11.0f}"
+            f"{statistics.mean(timings['activities']) * 1000:>10.0f}"
+            f"{'%d/%d' % counts:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
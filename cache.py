@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+    - Entries can carry tags (e.g. a LineID) so all entries for a user can be dropped at once.
+    - Hits, misses and evictions are counted under `cache.<name>.*` in metrics.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=600):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        metrics.gauge(f"cache.{name}.size", lambda: len(self._data))
+        metrics.gauge(f"cache.{name}.hit_rate", self.hit_rate)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                metrics.incr(f"cache.{self.name}.misses")
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            metrics.incr(f"cache.{self.name}.hits")
+            return entry[1]
+
+    def set(self, key, value, tags=(), ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires_at, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                metrics.incr(f"cache.{self.name}.evictions")
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            keys = self._tags.pop(tag, set())
+            for key in keys:
+                if key in self._data:
+                    self._remove(key)
+        if keys:
+            logging.info(f"Invalidated {len(keys)} {self.name} cache entries for {tag}")
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+        }
+
+    def _remove(self, key):
+        # Caller must hold the lock
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+def fingerprint(rows):
+    """Stable hash of a list of Supabase rows (order-insensitive)."""
+    encoded = sorted(json.dumps(row, sort_keys=True, default=str) for row in rows)
+    return hashlib.sha1("\n".join(encoded).encode("utf-8")).hexdigest()
+
+
+# Callbacks run whenever the scraper writes new rows for a LineID in this process
+_rows_written_callbacks = []
+
+
+def on_rows_written(callback):
+    """Register callback(line_id) to run after new rows are written for that LineID."""
+    _rows_written_callbacks.append(callback)
+    return callback
+
+
+def rows_written(line_id):
+    for callback in _rows_written_callbacks:
+        try:
+            callback(line_id)
+        except Exception as e:
+            logging.warning(f"rows_written callback {callback} failed for {line_id}: {e}")
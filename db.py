@@ -0,0 +1,240 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from dotenv import load_dotenv
+from supabase import Client, create_client
+
+import metrics
+
+load_dotenv()
+
+# Tables
+LOGIN = "Login data"
+REGISTRATION = "Registration"
+ASSIGNMENTS = "Assignment table"
+ACTIVITIES = "Activity table"
+
+# Queries slower than this (milliseconds) are logged with their path and filters
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 500))
+
+Row = dict[str, Any]
+
+_lock = threading.Lock()
+_state = {"pid": None, "client": None}
+
+
+def client() -> Client:
+    """
+    The process-wide Supabase client, created on first use. Every module shares it, so
+    PostgREST requests reuse one pool of keep-alive connections instead of one per module.
+    """
+    # Created again after a fork: the httpx pool does not survive it
+    with _lock:
+        if _state["pid"] != os.getpid():
+            url = os.getenv("SUPABASE_URL", "https://opvnwapzljuxnncvpbrn.supabase.co")
+            key = os.getenv("SUPABASE_KEY")
+            if not key:
+                logging.error("SUPABASE_KEY not set in .env file.")
+                raise Exception("SUPABASE_KEY environment variable not set")
+            _state.update(pid=os.getpid(), client=create_client(url, key))
+        return _state["client"]
+
+
+def table(table_name: str):
+    return client().table(table_name)
+
+
+def _slug(table_name):
+    return table_name.lower().replace(" ", "_")
+
+
+def missing_column(error: Exception) -> bool:
+    # PostgREST reports an unknown column as 42703 (Postgres) or PGRST204 (schema cache)
+    code = str(getattr(error, "code", "") or "")
+    return code in ("42703", "PGRST204") or "42703" in str(error) or "PGRST204" in str(error)
+
+
+def run(query, name: str):
+    """
+    Execute a query builder, recording db.<name>.calls / errors / latency.
+    Queries slower than SLOW_QUERY_MS are counted in db.slow_queries and logged.
+    Exceptions are re-raised.
+    """
+    start = time.perf_counter()
+    try:
+        return query.execute()
+    except Exception:
+        metrics.incr(f"db.{name}.errors")
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.incr(f"db.{name}.calls")
+        metrics.observe(f"db.{name}.latency", elapsed)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            metrics.incr("db.slow_queries")
+            logging.warning(
+                f"Slow query {name} ({elapsed * 1000:.0f} ms): "
+                f"{getattr(query, 'http_method', '')} {getattr(query, 'path', '')} "
+                f"{getattr(query, 'params', '')}"
+            )
+
+
+# "Login data": one row per registered LINE user
+
+
+def get_login(line_id: str, columns: str = "LineID") -> Optional[Row]:
+    response = run(table(LOGIN).select(columns).eq("LineID", line_id), "login_data.get")
+    return response.data[0] if response.data else None
+
+
+def list_logins(columns: str) -> list[Row]:
+    return run(table(LOGIN).select(columns), "login_data.list").data or []
+
+
+def insert_login(row: Row) -> list[Row]:
+    return run(table(LOGIN).insert(row), "login_data.insert").data or []
+
+
+def update_login(line_id: str, values: Row) -> None:
+    run(table(LOGIN).update(values).eq("LineID", line_id), "login_data.update")
+
+
+# "Registration": one row per user part-way through registering, with their role and the
+# portal ID / password collected so far
+
+
+def get_registration(line_id: str) -> Optional[Row]:
+    response = run(
+        table(REGISTRATION).select("LineID, Role, PortalID, Ps").eq("LineID", line_id),
+        "registration.get",
+    )
+    return response.data[0] if response.data else None
+
+
+def save_registration(row: Row) -> None:
+    run(table(REGISTRATION).upsert(row, on_conflict="LineID"), "registration.save")
+
+
+def delete_registration(line_id: str) -> None:
+    run(table(REGISTRATION).delete().eq("LineID", line_id), "registration.delete")
+
+
+def claim_verification(line_id: str, now: str, stale_before: str) -> bool:
+    """
+    Mark a registration's portal check as running, unless one started after `stale_before`.
+    The conditional update is atomic, so of several bot processes only one gets True.
+    """
+    response = run(
+        table(REGISTRATION)
+        .update({"VerifyingAt": now})
+        .eq("LineID", line_id)
+        .or_(f"VerifyingAt.is.null,VerifyingAt.lt.{stale_before}"),
+        "registration.claim",
+    )
+    return bool(response.data)
+
+
+def release_verification(line_id: str) -> None:
+    run(
+        table(REGISTRATION).update({"VerifyingAt": None}).eq("LineID", line_id),
+        "registration.release",
+    )
+
+
+# Scraped tables ("Assignment table" / "Activity table")
+
+
+def upcoming_rows(
+    table_name: str,
+    columns: str,
+    since: str,
+    *,
+    line_ids: Optional[Iterable[str]] = None,
+    until: Optional[str] = None,
+    created_after: Optional[str] = None,
+    refine: Optional[Callable] = None,
+    name: str = "upcoming",
+) -> list[Row]:
+    """
+    Rows whose end_datetime is at or after `since` (and before or at `until`), optionally
+    for some LineIDs or only rows created after `created_after`. `refine` may add further
+    filters, ordering or a limit to the query builder.
+    """
+    query = table(table_name).select(columns).gte("end_datetime", since)
+    if line_ids is not None:
+        line_ids = list(line_ids)
+        if len(line_ids) == 1:
+            query = query.eq("LineID", line_ids[0])
+        else:
+            query = query.in_("LineID", line_ids)
+    if until is not None:
+        query = query.lte("end_datetime", until)
+    if created_after is not None:
+        query = query.gt("created_at", created_after)
+    if refine is not None:
+        query = refine(query)
+    return run(query, f"{_slug(table_name)}.{name}").data or []
+
+
+def upsert_rows(table_name: str, rows: list[Row], on_conflict: str) -> list[Row]:
+    # Only newly inserted rows are returned, duplicates of the natural key are skipped
+    response = run(
+        table(table_name).upsert(rows, on_conflict=on_conflict, ignore_duplicates=True),
+        f"{_slug(table_name)}.upsert",
+    )
+    return response.data or []
+
+
+def insert_rows(table_name: str, rows: list[Row]) -> list[Row]:
+    return run(table(table_name).insert(rows), f"{_slug(table_name)}.insert").data or []
+
+
+def delete_ended_before(table_name: str, cutoff: str) -> list[Row]:
+    return (
+        run(
+            table(table_name).delete().lt("end_datetime", cutoff),
+            f"{_slug(table_name)}.delete_ended",
+        ).data
+        or []
+    )
+
+
+# Rows per page of a whole-table read; PostgREST returns at most 1000 rows per request
+PAGE_SIZE = 1000
+
+
+def select_rows(table_name: str, columns: str, null_column: Optional[str] = None) -> list[Row]:
+    """
+    Whole-table reads for maintenance commands (dedupe, backfill), optionally only rows where
+    `null_column` is null. Read PAGE_SIZE rows at a time in id order until a short page.
+    """
+    rows: list[Row] = []
+    while True:
+        query = table(table_name).select(columns)
+        if null_column is not None:
+            query = query.is_(null_column, "null")
+        query = query.order("id").range(len(rows), len(rows) + PAGE_SIZE - 1)
+        page = run(query, f"{_slug(table_name)}.select").data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+
+
+def update_where(table_name: str, column: str, value: Any, values: Row) -> None:
+    run(table(table_name).update(values).eq(column, value), f"{_slug(table_name)}.update")
+
+
+def update_ids(table_name: str, ids: list, values: Row) -> None:
+    run(table(table_name).update(values).in_("id", ids), f"{_slug(table_name)}.update_ids")
+
+
+def delete_ids(table_name: str, ids: list) -> None:
+    run(table(table_name).delete().in_("id", ids), f"{_slug(table_name)}.delete_ids")
+
+
+# Remove all of a user's rows from a table keyed by LineID
+def delete_line_id(table_name: str, line_id: str) -> None:
+    run(table(table_name).delete().eq("LineID", line_id), f"{_slug(table_name)}.delete")
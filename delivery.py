@@ -0,0 +1,145 @@
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from linebot.v3.messaging import MulticastRequest, PushMessageRequest, TextMessage
+
+import messaging
+import metrics
+
+# Push/multicast requests in flight at once
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", 4))
+# Retries after a 429 or 5xx before a message is given up on (its reminders stay unflagged)
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", 5))
+# First backoff in seconds when LINE sends no Retry-After; doubled on every retry
+DELIVERY_BACKOFF = float(os.getenv("DELIVERY_BACKOFF", 1.0))
+
+# LINE Messaging API limits
+MULTICAST_LIMIT = 500
+TEXT_LIMIT = 5000
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=DELIVERY_CONCURRENCY, thread_name_prefix="delivery"
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def compose(reminders):
+    """One text for all of a user's due reminders, nearest deadline first."""
+    if len(reminders) == 1:
+        r = reminders[0]
+        return f"You have the {r['kind']} ({r['name']}) due in {r['label']}"
+    lines = [f"You have {len(reminders)} reminders:"]
+    for i, r in enumerate(reminders):
+        line = f"- {r['kind']} ({r['name']}) due in {r['label']}"
+        if sum(len(l) + 1 for l in lines) + len(line) > TEXT_LIMIT - 20:
+            lines.append(f"...and {len(reminders) - i} more")
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def plan(reminders):
+    """
+    Group reminders into outbound requests: one message per user, and users who would get
+    exactly the same text share a multicast (e.g. a whole course with the same deadline).
+    """
+    by_user = {}
+    for reminder in reminders:
+        by_user.setdefault(reminder["LineID"], []).append(reminder)
+    by_text = {}
+    for user_id, items in by_user.items():
+        text = compose(sorted(items, key=lambda r: r["end"]))
+        by_text.setdefault(text, []).append((user_id, items))
+    batches = []
+    for text, recipients in by_text.items():
+        for i in range(0, len(recipients), MULTICAST_LIMIT):
+            chunk = recipients[i : i + MULTICAST_LIMIT]
+            batches.append(
+                {
+                    "text": text,
+                    "to": [user_id for user_id, _ in chunk],
+                    "reminders": [r for _, items in chunk for r in items],
+                }
+            )
+    return batches
+
+
+def retry_delay(error, attempt):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return DELIVERY_BACKOFF * 2**attempt * (1 + random.random() / 2)
+
+
+def send_batch(batch):
+    """Send one planned message, retrying 429s and server errors with backoff."""
+    endpoint = "push" if len(batch["to"]) == 1 else "multicast"
+    messages = [TextMessage(text=batch["text"])]
+    # Same retry key on every attempt, so LINE drops a duplicate of a request that did arrive
+    retry_key = str(uuid.uuid4())
+    for attempt in range(DELIVERY_MAX_RETRIES + 1):
+        try:
+            if endpoint == "push":
+                messaging.call(
+                    "push_message",
+                    PushMessageRequest(to=batch["to"][0], messages=messages),
+                    x_line_retry_key=retry_key,
+                )
+            else:
+                messaging.call(
+                    "multicast",
+                    MulticastRequest(to=batch["to"], messages=messages),
+                    x_line_retry_key=retry_key,
+                )
+            metrics.incr(f"delivery.{endpoint}")
+            metrics.incr("delivery.recipients", len(batch["to"]))
+            return True
+        except Exception as e:
+            status = getattr(e, "status", None)
+            if status == 409:
+                # Accepted earlier under the same retry key
+                return True
+            if (status == 429 or (status or 0) >= 500) and attempt < DELIVERY_MAX_RETRIES:
+                delay = retry_delay(e, attempt)
+                metrics.incr("delivery.retries")
+                logging.warning(f"LINE {endpoint} returned {status}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            metrics.incr("delivery.failed")
+            logging.error(f"Failed to {endpoint} to {len(batch['to'])} users: {e}")
+            return False
+
+
+def deliver(reminders):
+    """
+    Send reminders grouped per user and multicast across users, DELIVERY_CONCURRENCY requests
+    at a time. Returns the reminders that were delivered.
+    """
+    if not reminders:
+        return []
+    start = time.perf_counter()
+    batches = plan(reminders)
+    results = list(executor().map(send_batch, batches))
+    delivered = [r for batch, ok in zip(batches, results) if ok for r in batch["reminders"]]
+    metrics.observe("delivery.batch_time", time.perf_counter() - start)
+    logging.info(
+        f"Delivered {len(delivered)}/{len(reminders)} reminders in {len(batches)} requests "
+        f"({time.perf_counter() - start:.2f}s)"
+    )
+    return delivered
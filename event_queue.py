@@ -0,0 +1,69 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+import metrics
+
+
+class EventQueue:
+    """
+    Bounded in-process work queue drained by a fixed pool of worker threads.
+    - submit() never blocks: it returns False when the queue is full so the caller can fall back.
+    - Workers are started lazily on the first submit (and again after a fork), so the queue is
+      safe to create at import time under gunicorn's --preload.
+    - Records queue depth, wait time and handler latency under the given metrics name.
+    """
+
+    def __init__(self, handler, workers=4, maxsize=100, name="webhook"):
+        self.handler = handler
+        self.workers = workers
+        self.name = name
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._pid = None
+        metrics.gauge(f"{name}.queue_depth", self._queue.qsize)
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so (re)start them in whichever process submits first
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"{self.name}-worker-{i}", daemon=True
+                )
+                thread.start()
+            self._pid = os.getpid()
+            logging.info(f"Started {self.workers} {self.name} workers in pid {self._pid}")
+
+    def submit(self, item):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.perf_counter(), item))
+        except queue.Full:
+            metrics.incr(f"{self.name}.rejected")
+            logging.warning(f"{self.name} queue full ({self._queue.maxsize}), rejecting item")
+            return False
+        metrics.incr(f"{self.name}.enqueued")
+        return True
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            enqueued_at, item = self._queue.get()
+            metrics.observe(f"{self.name}.wait_time", time.perf_counter() - enqueued_at)
+            try:
+                with metrics.timer(f"{self.name}.handle_time"):
+                    self.handler(item)
+                metrics.incr(f"{self.name}.processed")
+            except Exception as e:
+                metrics.incr(f"{self.name}.failed")
+                logging.error(f"{self.name} worker failed to handle item: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,6 @@
+import os
+
+# gunicorn picks this file up automatically from the working directory.
+# With PRELOAD_MODEL=1 the app (and the BART model, see model_server.warm) is loaded once
+# in the master before forking, so every worker shares the same weights copy-on-write.
+preload_app = os.getenv("PRELOAD_MODEL", "0").lower() in ("1", "true", "yes")
@@ -0,0 +1,118 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the LINE Messaging API endpoints the bot calls, for offline runs:
+#   python line_api_stub.py --port 8766 --rate-limit 5
+#   LINE_API_HOST=http://127.0.0.1:8766 python reminder.py
+# GET /stats returns the number of requests, recipients, 429s and 409s served so far.
+# Like LINE, a request whose X-Line-Retry-Key was already accepted gets a 409.
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+STATS = {"push": 0, "multicast": 0, "reply": 0, "recipients": 0, "rate_limited": 0, "duplicates": 0}
+RETRY_KEYS = []  # X-Line-Retry-Key of every push/multicast received, in order
+ACCEPTED_KEYS = set()
+LOCK = threading.Lock()
+OPTIONS = {"latency": 0.0, "rate_limit": 0}
+_window = {"start": 0.0, "count": 0}
+
+
+def rate_limited():
+    # At most OPTIONS["rate_limit"] requests per second, like LINE's per-channel limit
+    if not OPTIONS["rate_limit"]:
+        return False
+    with LOCK:
+        now = time.time()
+        if now - _window["start"] >= 1:
+            _window["start"], _window["count"] = now, 0
+        _window["count"] += 1
+        if _window["count"] > OPTIONS["rate_limit"]:
+            STATS["rate_limited"] += 1
+            return True
+    return False
+
+
+class LineApiHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def send_json(self, body, status=200, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with LOCK:
+                return self.send_json(dict(STATS))
+        self.send_json({"message": "Not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        endpoint = self.path.rsplit("/", 1)[-1]
+        if endpoint not in ("push", "multicast", "reply"):
+            return self.send_json({"message": "Not found"}, status=404)
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self.send_json({"message": "Authentication failed"}, status=401)
+        time.sleep(OPTIONS["latency"])
+        retry_key = self.headers.get("X-Line-Retry-Key")
+        if retry_key:
+            with LOCK:
+                RETRY_KEYS.append(retry_key)
+        if rate_limited():
+            return self.send_json(
+                {"message": "The API rate limit has been exceeded."},
+                status=429,
+                headers={"Retry-After": "1"},
+            )
+        recipients = body.get("to", [])
+        recipients = recipients if isinstance(recipients, list) else [recipients]
+        with LOCK:
+            duplicate = retry_key in ACCEPTED_KEYS
+            if duplicate:
+                STATS["duplicates"] += 1
+            elif retry_key:
+                ACCEPTED_KEYS.add(retry_key)
+        if duplicate:
+            return self.send_json(
+                {"message": "The retry key is already accepted"},
+                status=409,
+                headers={"X-Line-Accepted-Request-Id": "stub"},
+            )
+        with LOCK:
+            STATS[endpoint] += 1
+            STATS["recipients"] += len(recipients)
+        for message in body.get("messages", []):
+            logging.info(f"{endpoint} -> {len(recipients) or 1} users: {message.get('text', '')!r}")
+        if endpoint == "multicast":
+            return self.send_json({})
+        sent = [{"id": str(i), "quoteToken": "stub"} for i in range(len(body.get("messages", [])))]
+        self.send_json({"sentMessages": sent})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stub LINE Messaging API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=float, default=50, help="added to every request")
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests/second before 429s")
+    args = parser.parse_args()
+    OPTIONS["latency"] = args.latency_ms / 1000
+    OPTIONS["rate_limit"] = args.rate_limit
+    server = ThreadingHTTPServer((args.host, args.port), LineApiHandler)
+    logging.info(f"Stub LINE Messaging API on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from linebot.v3.messaging import ApiClient, Configuration, MessagingApi
+
+import metrics
+
+# Keep-alive connections to the LINE API kept open per process
+LINE_POOL_SIZE = int(os.getenv("LINE_POOL_SIZE", 10))
+# Threads sending messages queued with send_async()
+LINE_SEND_WORKERS = int(os.getenv("LINE_SEND_WORKERS", 4))
+
+_lock = threading.Lock()
+_state = {"pid": None, "api": None, "executor": None, "pending": 0}
+
+
+def _ensure():
+    # One client and send pool per process: urllib3 pools and threads do not survive a fork
+    with _lock:
+        if _state["pid"] != os.getpid():
+            # LINE_API_HOST points the client at line_api_stub.py for offline runs
+            configuration = Configuration(
+                access_token=os.getenv("CHANNEL_ACCESS_TOKEN"), host=os.getenv("LINE_API_HOST")
+            )
+            configuration.connection_pool_maxsize = LINE_POOL_SIZE
+            _state.update(
+                pid=os.getpid(),
+                api=MessagingApi(api_client=ApiClient(configuration=configuration)),
+                executor=ThreadPoolExecutor(
+                    max_workers=LINE_SEND_WORKERS, thread_name_prefix="line-send"
+                ),
+                pending=0,
+            )
+        return _state
+
+
+def call(endpoint, *args, **kwargs):
+    """
+    Call MessagingApi.<endpoint> (reply_message, push_message, multicast, ...) on the shared
+    pooled client, recording latency and errors per endpoint. Exceptions are re-raised.
+    """
+    api = _ensure()["api"]
+    start = time.perf_counter()
+    try:
+        return getattr(api, endpoint)(*args, **kwargs)
+    except Exception as e:
+        metrics.incr(f"line.{endpoint}.errors")
+        status = getattr(e, "status", None)
+        if status:
+            metrics.incr(f"line.{endpoint}.status_{status}")
+        raise
+    finally:
+        metrics.incr(f"line.{endpoint}.calls")
+        metrics.observe(f"line.{endpoint}.latency", time.perf_counter() - start)
+
+
+def send_async(endpoint, *args, **kwargs):
+    """
+    Queue call(endpoint, ...) on the send pool so the caller does not wait for LINE.
+    Returns a Future; failures are logged.
+    """
+    state = _ensure()
+    with _lock:
+        state["pending"] += 1
+
+    def done(future):
+        with _lock:
+            state["pending"] -= 1
+        if future.exception() is not None:
+            logging.error(f"LINE {endpoint} failed: {future.exception()}")
+
+    future = state["executor"].submit(call, endpoint, *args, **kwargs)
+    future.add_done_callback(done)
+    return future
+
+
+metrics.gauge("line.pending", lambda: _state["pending"])
+
@@ -0,0 +1,96 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds or counts) for histogram buckets; anything above the
+# last bound lands in the "+Inf" bucket.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+
+
+def incr(name, value=1):
+    """Increase the counter called `name` by `value`."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS):
+    """Record one sample for the histogram called `name`."""
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = {
+                "count": 0,
+                "sum": 0.0,
+                "min": None,
+                "max": None,
+                "buckets": {bound: 0 for bound in buckets},
+                "inf": 0,
+            }
+            _histograms[name] = hist
+        hist["count"] += 1
+        hist["sum"] += value
+        hist["min"] = value if hist["min"] is None else min(hist["min"], value)
+        hist["max"] = value if hist["max"] is None else max(hist["max"], value)
+        for bound in hist["buckets"]:
+            if value <= bound:
+                hist["buckets"][bound] += 1
+                break
+        else:
+            hist["inf"] += 1
+
+
+def gauge(name, value_or_fn):
+    """
+    Set the gauge called `name`.
+    A callable is evaluated lazily on every snapshot (e.g. a queue's qsize).
+    """
+    with _lock:
+        _gauges[name] = value_or_fn
+
+
+@contextmanager
+def timer(name):
+    """Observe the wall-clock duration of the `with` block, in seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot():
+    """Return a JSON-serialisable copy of every counter, gauge and histogram."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {}
+        for name, hist in _histograms.items():
+            buckets = {str(bound): count for bound, count in hist["buckets"].items()}
+            buckets["+Inf"] = hist["inf"]
+            histograms[name] = {
+                "count": hist["count"],
+                "sum": hist["sum"],
+                "avg": hist["sum"] / hist["count"] if hist["count"] else 0.0,
+                "min": hist["min"],
+                "max": hist["max"],
+                "buckets": buckets,
+            }
+    for name, value in gauges.items():
+        if callable(value):
+            try:
+                gauges[name] = value()
+            except Exception:
+                gauges[name] = None
+    return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+
+def reset():
+    """Forget recorded counters and histograms (used by benchmark scripts between runs)."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
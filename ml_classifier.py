@@ -4,9 +4,11 @@ import re
 from datetime import datetime, timezone, timedelta
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
-from supabase import create_client, Client
-from dotenv import load_dotenv
-from transformers import pipeline
+import db
+import metrics
+import model_server
+from cache import TTLCache, fingerprint, on_rows_written
+from portal_dates import date_fields, date_info
 
 # Configure logging
 logging.basicConfig(
@@ -16,21 +18,12 @@ logging.getLogger("supabase").setLevel(logging.WARNING)  # Suppress Supabase HTT
 logging.getLogger("httpx").setLevel(logging.WARNING)  # Suppress httpx HTTP logs
 logging.getLogger("http.client").setLevel(logging.WARNING)  # Suppress http.client logs
 
-# Load environment variables
-load_dotenv()
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-if not supabase_url or not supabase_key:
-    logging.error("SUPABASE_URL or SUPABASE_KEY not set in .env file.")
-    raise Exception("SUPABASE_URL or SUPABASE_KEY not set")
-supabase: Client = create_client(supabase_url, supabase_key)
-
-# Initialize ML model for sentence generation
-try:
-    generator = pipeline("text2text-generation", model="levii831/linebottest-model")
-except Exception as e:
-    logging.error(f"Failed to initialize fine-tuned bart-base: {e}")
-    raise
+# The BART generator is loaded lazily on first use by model_server.get_generator()
+
+# Scrape a student on demand when their stored rows are older than SCRAPE_STALENESS_BUDGET
+ON_DEMAND_SCRAPE = os.getenv("ON_DEMAND_SCRAPE", "0").lower() in ("1", "true", "yes")
+if ON_DEMAND_SCRAPE:
+    from scrape_on_demand import refresh_student
 
 # Course ID to name mapping
 COURSE_MAPPING = {
@@ -131,60 +124,34 @@ model = LogisticRegression()
 model.fit(X, labels)
 
 
+def date_kind(classification):
+    if classification in ("assignments", "nearest_assignments", "course_due_date"):
+        return "assignment"
+    return "activity"
+
+
 def parse_date(date_str, classification, include_day=True):
     """
     Parse date string and return formatted string or components for flexible formatting.
     - Assignments: Extract end date (e.g., '2025/05/14 08:17 ~ 2025/06/13 23:59' -> {'day': 'Friday', 'date': '2025-06-13', 'time': '23:59'}).
     - Activities: Extract start/end times (e.g., '2025.05.29(四) 下午 06:00 ~ 2025.05.29(四) 下午 08:00' -> {'day': 'Thursday', 'date': '2025-05-29', 'start_time': '18:00', 'end_time': '20:00'}).
+    Only used for rows scraped before the parsed date columns existed; see row_date_info.
     """
-    try:
-        if classification in ("assignments", "nearest_assignments", "course_due_date"):
-            # Extract end date (after ~)
-            match = re.search(r"~.*(\d{4}/\d{2}/\d{2})\s+(\d{2}:\d{2})", date_str)
-            if not match:
-                logging.warning(f"Invalid assignment date format: {date_str}")
-                return date_str
-            date_part, time_part = match.groups()
-            date_obj = datetime.strptime(date_part, "%Y/%m/%d")
-            formatted_date = date_obj.strftime("%Y-%m-%d")
-            day_of_week = date_obj.strftime("%A") if include_day else ""
-            return {"day": day_of_week, "date": formatted_date, "time": time_part}
-        else:
-            # Extract start and end times for activities
-            match = re.match(
-                r"(\d{4}\.\d{2}\.\d{2}).*(上午|下午)\s*(\d{2}:\d{2})\s*~\s*(\d{4}\.\d{2}\.\d{2}).*(上午|下午)\s*(\d{2}:\d{2})",
-                date_str,
-            )
-            if not match:
-                logging.warning(f"Invalid activity date format: {date_str}")
-                return date_str
-            start_date, start_period, start_time, end_date, end_period, end_time = (
-                match.groups()
-            )
-            start_hour, start_minute = map(int, start_time.split(":"))
-            end_hour, end_minute = map(int, end_time.split(":"))
-            # Convert to 24-hour format
-            if start_period == "下午" and start_hour != 12:
-                start_hour += 12
-            elif start_period == "上午" and start_hour == 12:
-                start_hour = 0
-            if end_period == "下午" and end_hour != 12:
-                end_hour += 12
-            elif end_period == "上午" and end_hour == 12:
-                end_hour = 0
-            start_date = start_date.replace(".", "-")
-            end_date = end_date.replace(".", "-")
-            date_obj = datetime.strptime(start_date, "%Y-%m-%d")
-            day_of_week = date_obj.strftime("%A") if include_day else ""
-            return {
-                "day": day_of_week,
-                "date": start_date,
-                "start_time": f"{start_hour:02d}:{start_minute:02d}",
-                "end_time": f"{end_hour:02d}:{end_minute:02d}",
-            }
-    except Exception as e:
-        logging.error(f"Failed to parse date '{date_str}' for {classification}: {e}")
+    kind = date_kind(classification)
+    fields = date_fields(date_str, kind)
+    if fields["end_datetime"] is None:
         return date_str
+    return date_info(fields, kind, include_day)
+
+
+def row_date_info(row, classification, date_field):
+    """
+    Date components of a fetched row, read from the columns the scraper precomputed.
+    Falls back to parsing the raw date string for older rows.
+    """
+    if row.get("display_date"):
+        return date_info(row, date_kind(classification))
+    return parse_date(row[date_field], classification, include_day=True)
 
 
 def clean_name(name, classification):
@@ -197,94 +164,308 @@ def clean_name(name, classification):
     return name
 
 
-def fetch_data(line_id, classification, course_id=None):
+def table_fields(classification):
     """
-    Fetch assignments or activities from Supabase for a given LineID.
-    For nearest_* classifications, return only the earliest item.
-    For course_due_date, filter by course ID.
+    Return (table name, name column, date column) holding the rows for a classification.
+    """
+    if classification in ("assignments", "nearest_assignments", "course_due_date"):
+        return db.ASSIGNMENTS, "AssignmentName", "AssignmentDate"
+    return db.ACTIVITIES, "ActivityName", "ActivityDate"
+
+
+# Read the date columns precomputed by the scraper; switched off for the rest of the process
+# if the tables have not been migrated yet (see README)
+PARSED_DATE_COLUMNS = os.getenv("PARSED_DATE_COLUMNS", "1").lower() in ("1", "true", "yes")
+
+
+def date_columns():
+    if not PARSED_DATE_COLUMNS:
+        return ""
+    return ", weekday, display_date, start_time, end_time"
+
+
+def disable_date_columns(error):
+    global PARSED_DATE_COLUMNS
+    PARSED_DATE_COLUMNS = False
+    logging.warning(f"Parsed date columns unavailable, parsing date strings instead: {error}")
+
+
+def fetch_rows(line_id, classification, course_id=None):
+    """
+    Fetch the raw upcoming rows from Supabase for a given LineID.
+    For course_due_date, filter by course ID. For nearest_* classifications only the
+    earliest row (by deadline, or by start time for activities) is returned, so the sort
+    and limit run in the database.
+    Returns None if the query failed.
     """
     try:
-        table_name = (
-            "Assignment table"
-            if classification
-            in ("assignments", "nearest_assignments", "course_due_date")
-            else "Activity table"
-        )
-        name_field = (
-            "AssignmentName"
-            if classification
-            in ("assignments", "nearest_assignments", "course_due_date")
-            else "ActivityName"
-        )
-        date_field = (
-            "AssignmentDate"
-            if classification
-            in ("assignments", "nearest_assignments", "course_due_date")
-            else "ActivityDate"
-        )
+        table_name, name_field, date_field = table_fields(classification)
 
         current_time = datetime.now(timezone(timedelta(hours=8))).isoformat()
-        query = (
-            supabase.table(table_name)
-            .select(f"{name_field}, {date_field}")
-            .eq("LineID", line_id)
-            .gte("end_datetime", current_time)
-        )
 
-        if classification == "course_due_date" and course_id:
-            query = query.ilike(name_field, f"%{course_id}%")
+        def refine(query):
+            if classification == "course_due_date" and course_id:
+                query = query.ilike(name_field, f"%{course_id}%")
+            elif classification == "nearest_activities" and PARSED_DATE_COLUMNS:
+                # Activities are "nearest" by when they start. Rows scraped before the date
+                # migration have no start_datetime and sort last until backfill-dates is run
+                query = query.order("start_datetime").order("end_datetime").limit(1)
+            elif classification in ("nearest_assignments", "nearest_activities"):
+                query = query.order("end_datetime").limit(1)
+            return query
+
+        def query(columns):
+            return db.upcoming_rows(
+                table_name,
+                columns,
+                current_time,
+                line_ids=[line_id],
+                refine=refine,
+                name="fetch",
+            )
 
-        response = query.execute()
+        try:
+            rows = query(f"{name_field}, {date_field}{date_columns()}")
+        except Exception as e:
+            if not PARSED_DATE_COLUMNS:
+                raise
+            if db.missing_column(e):
+                disable_date_columns(e)
+            else:
+                # Network errors, 5xx etc.: retry this once, keep the columns for later queries
+                logging.warning(f"Query with parsed date columns failed, retrying without: {e}")
+            rows = query(f"{name_field}, {date_field}")
 
-        if not response.data:
+        if not rows:
             logging.info(f"No {classification} found for LineID: {line_id}")
             return []
+        return rows
+    except Exception as e:
+        logging.error(f"Failed to fetch {classification} for LineID {line_id}: {e}")
+        return None
+
+
+def build_items(rows, classification):
+    """
+    Clean names and parse dates of fetched rows.
+    For nearest_* classifications, return only the earliest item.
+    """
+    try:
+        _, name_field, date_field = table_fields(classification)
 
         items = []
-        for item in response.data:
+        for item in rows:
             name = clean_name(item[name_field], classification)
-            date_info = parse_date(item[date_field], classification, include_day=True)
-            items.append({"name": name, "date_info": date_info})
+            items.append(
+                {"name": name, "date_info": row_date_info(item, classification, date_field)}
+            )
 
         if not items:
-            logging.info(
-                f"No valid {classification} after parsing for LineID: {line_id}"
-            )
             return []
 
-        # Sort for nearest classifications
-        if classification == "nearest_assignments":
-            items.sort(
-                key=lambda x: datetime.strptime(
-                    f"{x['date_info']['date']} {x['date_info']['time']}",
-                    "%Y-%m-%d %H:%M",
-                )
-            )
-            items = [items[0]]  # Return only the earliest
-        elif classification == "nearest_activities":
-            items.sort(
-                key=lambda x: datetime.strptime(
-                    f"{x['date_info']['date']} {x['date_info']['start_time']}",
-                    "%Y-%m-%d %H:%M",
-                )
-            )
-            items = [items[0]]  # Return only the earliest
+        # fetch_rows already returned only the earliest nearest_* row
+        if classification in ("nearest_assignments", "nearest_activities"):
+            items = items[:1]  # Return only the earliest
 
         return items
     except Exception as e:
-        logging.error(f"Failed to fetch {classification} for LineID {line_id}: {e}")
+        logging.error(f"Failed to parse {classification} rows: {e}")
         return []
 
 
+def fetch_data(line_id, classification, course_id=None):
+    """
+    Fetch assignments or activities from Supabase for a given LineID.
+    For nearest_* classifications, return only the earliest item.
+    For course_due_date, filter by course ID.
+    """
+    return build_items(fetch_rows(line_id, classification, course_id) or [], classification)
+
+
+def detect_tone(prompt):
+    return (
+        "casual"
+        if any(word in prompt.lower() for word in ["giv", "gimme", "hw", "yo"])
+        else "formal"
+    )
+
+
+def is_chinese_prompt(prompt):
+    return any(128 <= ord(c) <= 0x9FFF for c in prompt)  # Detect Chinese characters
+
+
+# Cache of finished replies keyed on (classification, course, rows fingerprint, tone, language).
+# Entries are tagged with the LineID and dropped when the scraper writes new rows for it.
+response_cache = TTLCache(
+    "responses",
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", 600)),
+)
+on_rows_written(response_cache.invalidate_tag)
+
+
+# Classifications where BART output may be used; everything else goes straight to the templates.
+# course_due_date is excluded by default because its model output was always discarded.
+BART_CLASSIFICATIONS = set(
+    c.strip()
+    for c in os.getenv(
+        "BART_CLASSIFICATIONS",
+        "assignments,activities,nearest_assignments,nearest_activities",
+    ).split(",")
+    if c.strip()
+)
+# Skip BART when a list has more items than this (0 = no limit); long lists rarely validate
+BART_MAX_ITEMS = int(os.getenv("BART_MAX_ITEMS", 0))
+
+# Day of week translation for Chinese
+DAY_TRANSLATION = {
+    "Monday": "星期一",
+    "Tuesday": "星期二",
+    "Wednesday": "星期三",
+    "Thursday": "星期四",
+    "Friday": "星期五",
+    "Saturday": "星期六",
+    "Sunday": "星期日",
+}
+
+
+# Fix Chinese spacing
+def fix_chinese_spacing(text):
+    return re.sub(r"預\s*定於", "預定於", text)
+
+
+def should_use_generator(classification, count):
+    """
+    Decide up front whether BART is worth running for this reply.
+    """
+    if classification not in BART_CLASSIFICATIONS:
+        return False
+    if BART_MAX_ITEMS and count > BART_MAX_ITEMS:
+        return False
+    return True
+
+
+def render_template(classification, items, tone, is_chinese, course_id=None):
+    """
+    Deterministic reply for a non-empty item list (the format the BART output is validated against).
+    - Nearest: "Your nearest [type] is:" followed by the single earliest item.
+    - Course due date: "The assignment for [course_id] ([course_name]) is:" or "You have N assignments for ...".
+    - Assignments/Activities: "You have N [type]:" followed by one line per item.
+    """
+    is_nearest = classification in ("nearest_assignments", "nearest_activities")
+    is_course_due = classification == "course_due_date"
+    type_label = (
+        "assignment"
+        if classification in ("assignments", "nearest_assignments", "course_due_date")
+        else "activity"
+    )
+    count = len(items)
+    type_label_plural = (
+        type_label
+        if is_nearest or is_course_due
+        else (
+            "assignments"
+            if type_label == "assignment"
+            else "activity" if count == 1 else "activities"
+        )
+    )
+
+    if is_nearest:
+        item = items[0]
+        if type_label == "assignment":
+            sentence = (
+                f"{item['name']}, due on {item['date_info']['day']}, {item['date_info']['date']}, {item['date_info']['time']}."
+                if not is_chinese
+                else f"{item['name']} 預定於 {DAY_TRANSLATION.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, {item['date_info']['time']} 到期。"
+            )
+        else:
+            sentence = (
+                f"{item['name']}, on {item['date_info']['day']}, {item['date_info']['date']}, from {item['date_info']['start_time']} to {item['date_info']['end_time']}."
+                if not is_chinese
+                else f"{item['name']} 於 {DAY_TRANSLATION.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, 從 {item['date_info']['start_time']} 至 {item['date_info']['end_time']}。"
+            )
+        prefix = (
+            f"Yo, your nearest {type_label} is:\n"
+            if tone == "casual"
+            else f"Your nearest {type_label} is:\n"
+        )
+        if is_chinese:
+            prefix = f"您最近的{'作業' if type_label == 'assignment' else '活動'}是：\n"
+        return f"{prefix}{sentence}"
+
+    if is_course_due:
+        course_name = COURSE_MAPPING.get(course_id.upper(), {}).get(
+            "zh" if is_chinese else "en", course_id
+        )
+        if count == 1:
+            item = items[0]
+            sentence = (
+                f"{item['name']}, due on {item['date_info']['day']}, {item['date_info']['date']}, {item['date_info']['time']}."
+                if not is_chinese
+                else f"{item['name']} 預定於 {DAY_TRANSLATION.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, {item['date_info']['time']} 到期。"
+            )
+            prefix = (
+                f"Yo, the assignment for {course_id} ({course_name}) is:\n"
+                if tone == "casual"
+                else f"The assignment for {course_id} ({course_name}) is:\n"
+            )
+            if is_chinese:
+                prefix = f"{course_id}（{course_name}）的作業是：\n"
+            return f"{prefix}{sentence}"
+        sentences = [
+            (
+                f"{item['name']} is due on {item['date_info']['day']}, {item['date_info']['date']}, {item['date_info']['time']}.\n"
+                if not is_chinese
+                else f"{item['name']} 預定於 {DAY_TRANSLATION.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, {item['date_info']['time']} 到期。\n"
+            )
+            for item in items
+        ]
+        prefix = (
+            f"Yo, you got {count} assignments for {course_id} ({course_name}):\n"
+            if tone == "casual"
+            else f"You have {count} assignments for {course_id} ({course_name}):\n"
+        )
+        if is_chinese:
+            prefix = f"{course_id}（{course_name}）有{count}項作業：\n"
+        return f"{prefix}{''.join(sentences)}"
+
+    if type_label == "assignment":
+        sentences = [
+            f"{item['name']} is due on {item['date_info']['day']}, {item['date_info']['date']}, {item['date_info']['time']}.\n"
+            for item in items
+        ]
+    else:
+        sentences = [
+            f"{item['name']} on {item['date_info']['day']}, {item['date_info']['date']}, from {item['date_info']['start_time']} to {item['date_info']['end_time']}.\n"
+            for item in items
+        ]
+    prefix = (
+        f"Yo, you got {count} {type_label_plural}:\n"
+        if tone == "casual"
+        else f"You have {count} {type_label_plural}:\n"
+    )
+    if is_chinese:
+        prefix = f"您有{count}項{'作業' if type_label == 'assignment' else '活動'}：\n"
+        if type_label == "assignment":
+            sentences = [
+                f"{item['name']} 預定於 {DAY_TRANSLATION.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, {item['date_info']['time']} 到期。\n"
+                for item in items
+            ]
+        else:
+            sentences = [
+                f"{item['name']} 於 {DAY_TRANSLATION.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, 從 {item['date_info']['start_time']} 至 {item['date_info']['end_time']}。\n"
+                for item in items
+            ]
+    return f"{prefix}{''.join(sentences)}"
+
+
 def generate_ml_sentence(prompt, classification, items, course_id=None):
     """
     Generate a natural sentence using bart-base or fixed responses, ensuring all items are listed.
     - Greeting: Return a playful introduction for WaiZiYu.
     - Capabilities: Describe WaiZiYu's features.
-    - Assignments: Use "[name] is due on [day], [date], [time]."
-    - Activities: Use "[name] on [day], [date], from [start_time] to [end_time]."
-    - Nearest: Use "Your nearest [type] is [name], due on..." or "...on [day], [date], from..."
-    - Course due date: Use "The assignment for [course_id] ([course_name]) is [name], due on [day], [date], [time]."
+    - Item lists: BART output is used only when should_use_generator() allows it and the
+      output names every item with the expected count; otherwise render_template() is used.
     - Chinese output for Chinese prompts with translated day of week.
     """
     try:
@@ -306,29 +487,8 @@ def generate_ml_sentence(prompt, classification, items, course_id=None):
                 else "activity" if count == 1 else "activities"
             )
         )
-        tone = (
-            "casual"
-            if any(word in prompt.lower() for word in ["giv", "gimme", "hw", "yo"])
-            else "formal"
-        )
-        is_chinese = any(
-            128 <= ord(c) <= 0x9FFF for c in prompt
-        )  # Detect Chinese characters
-
-        # Day of week translation for Chinese
-        day_translation = {
-            "Monday": "星期一",
-            "Tuesday": "星期二",
-            "Wednesday": "星期三",
-            "Thursday": "星期四",
-            "Friday": "星期五",
-            "Saturday": "星期六",
-            "Sunday": "星期日",
-        }
-
-        # Fix Chinese spacing
-        def fix_chinese_spacing(text):
-            return re.sub(r"預\s*定於", "預定於", text)
+        tone = detect_tone(prompt)
+        is_chinese = is_chinese_prompt(prompt)
 
         # Handle greeting classification
         if classification == "greeting":
@@ -359,6 +519,13 @@ def generate_ml_sentence(prompt, classification, items, course_id=None):
                 )
             return f"Sorry, you have no upcoming {type_label_plural}."
 
+        if not should_use_generator(classification, count):
+            metrics.incr("generation.skipped")
+            metrics.incr(f"generation.skipped.{classification}")
+            return fix_chinese_spacing(
+                render_template(classification, items, tone, is_chinese, course_id).strip()
+            )
+
         # Prepare input for the model
         if classification in ("assignments", "nearest_assignments", "course_due_date"):
             items_text = "; ".join(
@@ -383,28 +550,13 @@ def generate_ml_sentence(prompt, classification, items, course_id=None):
             f"{'For course ' + course_id + ': ' if is_course_due else ''}Data: {items_text}."
         )
 
-        result = generator(
+        result = model_server.generate(
             input_text,
             max_length=100 if is_nearest or is_course_due else 200,
             num_beams=5,
-        )[0]["generated_text"]
+        )
         result = fix_chinese_spacing(result)
 
-        # Post-process to ensure correct output
-        if count == 0:
-            if is_course_due:
-                course_name = COURSE_MAPPING.get(course_id.upper(), {}).get(
-                    "zh" if is_chinese else "en", course_id
-                )
-                if is_chinese:
-                    return fix_chinese_spacing(f"抱歉，沒有找到{course_name}的作業。")
-                return f"No assignments found for {course_id} ({course_name})."
-            if is_chinese:
-                return fix_chinese_spacing(
-                    f"抱歉，您沒有即將到來的{'作業' if type_label == 'assignment' else '活動'}。"
-                )
-            return f"Sorry, you have no upcoming {type_label_plural}."
-
         # Clean up unwanted prefixes
         if result.startswith("Summarize the"):
             result = result.split(".", 1)[-1].strip() if "." in result else result
@@ -418,93 +570,12 @@ def generate_ml_sentence(prompt, classification, items, course_id=None):
             or is_course_due
         ):
             # Fallback to manual construction with improved formatting
-            if is_nearest:
-                item = items[0]
-                if type_label == "assignment":
-                    sentence = (
-                        f"{item['name']}, due on {item['date_info']['day']}, {item['date_info']['date']}, {item['date_info']['time']}."
-                        if not is_chinese
-                        else f"{item['name']} 預定於 {day_translation.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, {item['date_info']['time']} 到期。"
-                    )
-                else:
-                    sentence = (
-                        f"{item['name']}, on {item['date_info']['day']}, {item['date_info']['date']}, from {item['date_info']['start_time']} to {item['date_info']['end_time']}."
-                        if not is_chinese
-                        else f"{item['name']} 於 {day_translation.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, 從 {item['date_info']['start_time']} 至 {item['date_info']['end_time']}。"
-                    )
-                prefix = (
-                    f"Yo, your nearest {type_label} is:\n"
-                    if tone == "casual"
-                    else f"Your nearest {type_label} is:\n"
-                )
-                if is_chinese:
-                    prefix = f"您最近的{'作業' if type_label == 'assignment' else '活動'}是：\n"
-                result = f"{prefix}{sentence}"
-            elif is_course_due:
-                course_name = COURSE_MAPPING.get(course_id.upper(), {}).get(
-                    "zh" if is_chinese else "en", course_id
-                )
-                if count == 1:
-                    item = items[0]
-                    sentence = (
-                        f"{item['name']}, due on {item['date_info']['day']}, {item['date_info']['date']}, {item['date_info']['time']}."
-                        if not is_chinese
-                        else f"{item['name']} 預定於 {day_translation.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, {item['date_info']['time']} 到期。"
-                    )
-                    prefix = (
-                        f"Yo, the assignment for {course_id} ({course_name}) is:\n"
-                        if tone == "casual"
-                        else f"The assignment for {course_id} ({course_name}) is:\n"
-                    )
-                    if is_chinese:
-                        prefix = f"{course_id}（{course_name}）的作業是：\n"
-                    result = f"{prefix}{sentence}"
-                else:
-                    sentences = [
-                        (
-                            f"{item['name']} is due on {item['date_info']['day']}, {item['date_info']['date']}, {item['date_info']['time']}.\n"
-                            if not is_chinese
-                            else f"{item['name']} 預定於 {day_translation.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, {item['date_info']['time']} 到期。\n"
-                        )
-                        for item in items
-                    ]
-                    prefix = (
-                        f"Yo, you got {count} assignments for {course_id} ({course_name}):\n"
-                        if tone == "casual"
-                        else f"You have {count} assignments for {course_id} ({course_name}):\n"
-                    )
-                    if is_chinese:
-                        prefix = f"{course_id}（{course_name}）有{count}項作業：\n"
-                    result = f"{prefix}{''.join(sentences)}"
-            else:
-                if type_label == "assignment":
-                    sentences = [
-                        f"{item['name']} is due on {item['date_info']['day']}, {item['date_info']['date']}, {item['date_info']['time']}.\n"
-                        for item in items
-                    ]
-                else:
-                    sentences = [
-                        f"{item['name']} on {item['date_info']['day']}, {item['date_info']['date']}, from {item['date_info']['start_time']} to {item['date_info']['end_time']}.\n"
-                        for item in items
-                    ]
-                prefix = (
-                    f"Yo, you got {count} {type_label_plural}:\n"
-                    if tone == "casual"
-                    else f"You have {count} {type_label_plural}:\n"
-                )
-                if is_chinese:
-                    prefix = f"您有{count}項{'作業' if type_label == 'assignment' else '活動'}：\n"
-                    if type_label == "assignment":
-                        sentences = [
-                            f"{item['name']} 預定於 {day_translation.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, {item['date_info']['time']} 到期。\n"
-                            for item in items
-                        ]
-                    else:
-                        sentences = [
-                            f"{item['name']} 於 {day_translation.get(item['date_info']['day'], item['date_info']['day'])}, {item['date_info']['date']}, 從 {item['date_info']['start_time']} 至 {item['date_info']['end_time']}。\n"
-                            for item in items
-                        ]
-                result = f"{prefix}{''.join(sentences)}"
+            metrics.incr("generation.discarded")
+            metrics.incr(f"generation.discarded.{classification}")
+            result = render_template(classification, items, tone, is_chinese, course_id)
+        else:
+            metrics.incr("generation.accepted")
+            metrics.incr(f"generation.accepted.{classification}")
 
         return fix_chinese_spacing(result.strip())
     except Exception as e:
@@ -528,8 +599,9 @@ def classify_prompt(prompt, line_id):
     Classify a user prompt and fetch relevant data.
     """
     try:
-        X_prompt = vectorizer.transform([prompt])
-        prediction = model.predict(X_prompt)[0]
+        with metrics.timer("stage.classify"):
+            X_prompt = vectorizer.transform([prompt])
+            prediction = model.predict(X_prompt)[0]
 
         # Extract course ID for course_due_date
         course_id = None
@@ -571,8 +643,32 @@ def classify_prompt(prompt, line_id):
 
         logging.info(f"Prompt: '{prompt}' classified as '{prediction}'")
 
-        items = fetch_data(line_id, prediction, course_id=course_id)
-        sentence = generate_ml_sentence(prompt, prediction, items, course_id=course_id)
+        # Greetings and capabilities do not depend on any stored data
+        rows = []
+        if prediction not in ("greeting", "capabilities"):
+            if ON_DEMAND_SCRAPE:
+                with metrics.timer("stage.refresh"):
+                    refresh_student(line_id)
+            with metrics.timer("stage.fetch"):
+                rows = fetch_rows(line_id, prediction, course_id=course_id)
+
+        cache_key = (
+            prediction,
+            course_id,
+            fingerprint(rows or []),
+            detect_tone(prompt),
+            is_chinese_prompt(prompt),
+        )
+        sentence = response_cache.get(cache_key) if rows is not None else None
+        if sentence is None:
+            items = build_items(rows or [], prediction)
+            with metrics.timer("stage.generate"):
+                sentence = generate_ml_sentence(
+                    prompt, prediction, items, course_id=course_id
+                )
+            # Do not cache the apology produced by a failed fetch
+            if rows is not None:
+                response_cache.set(cache_key, sentence, tags=(line_id,))
         logging.info(f"Response for '{prompt}': {sentence}")
 
         return prediction, sentence
@@ -0,0 +1,253 @@
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+MODEL_NAME = os.getenv("GENERATOR_MODEL", "levii831/linebottest-model")
+# "transformers" (full precision), "quantized" (torch int8 dynamic) or "onnx" (ONNX Runtime)
+BACKEND = os.getenv("GENERATION_BACKEND", "transformers").lower()
+BACKENDS = ("transformers", "quantized", "onnx")
+# Micro-batching of concurrent generate() calls; a max batch of 1 disables it
+MAX_BATCH_SIZE = int(os.getenv("GENERATION_MAX_BATCH", 1))
+MAX_WAIT_MS = float(os.getenv("GENERATION_MAX_WAIT_MS", 10))
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+_generator = None
+_load_lock = threading.Lock()
+_load_error = None
+_load_seconds = None
+
+
+def load_pipeline(backend=BACKEND, model_name=MODEL_NAME):
+    """
+    Build a text2text-generation pipeline for the given backend.
+    - transformers: the original full-precision BartForConditionalGeneration.
+    - quantized: the same model with its Linear layers dynamically quantized to int8 (CPU only).
+    - onnx: an ONNX Runtime export (needs `pip install optimum[onnxruntime]`); exported on the
+      fly unless model_name already points to a directory produced by export_onnx().
+    """
+    # Imported here so that importing this module stays cheap
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
+
+    if backend == "transformers":
+        return pipeline("text2text-generation", model=model_name)
+    if backend == "quantized":
+        import torch
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        model = torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        return pipeline("text2text-generation", model=model, tokenizer=tokenizer)
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError as e:
+            raise Exception(
+                "GENERATION_BACKEND=onnx needs optimum[onnxruntime] installed"
+            ) from e
+        exported = os.path.exists(os.path.join(model_name, "encoder_model.onnx"))
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=not exported)
+        return pipeline("text2text-generation", model=model, tokenizer=tokenizer)
+    raise Exception(f"Unknown GENERATION_BACKEND {backend!r}, expected one of {BACKENDS}")
+
+
+def export_onnx(model_name=MODEL_NAME, output_dir="./bart-onnx"):
+    """
+    Export the fine-tuned model (e.g. ./bart-finetuned from finetune_bart.py) to ONNX so
+    GENERATOR_MODEL can point at output_dir without exporting on every start.
+    """
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer
+
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+    logging.info(f"Exported {model_name} to ONNX in {output_dir}")
+
+
+def get_generator():
+    """
+    Return the shared text2text-generation pipeline, loading it on first use.
+    Concurrent first callers wait on the same load instead of loading twice.
+    """
+    global _generator, _load_error, _load_seconds
+    if _generator is not None:
+        return _generator
+    with _load_lock:
+        if _generator is not None:
+            return _generator
+        logging.info(f"Loading generator model {MODEL_NAME} ({BACKEND})...")
+        start = time.perf_counter()
+        try:
+            _generator = load_pipeline(BACKEND, MODEL_NAME)
+        except Exception as e:
+            _load_error = str(e)
+            metrics.incr("model.load_failed")
+            logging.error(f"Failed to initialize fine-tuned bart-base: {e}")
+            raise
+        _load_error = None
+        _load_seconds = time.perf_counter() - start
+        metrics.observe("model.load_time", _load_seconds)
+        logging.info(f"Generator model loaded in {_load_seconds:.1f}s (pid {os.getpid()})")
+        return _generator
+
+
+def warm():
+    """
+    Load the model now instead of on the first message.
+    Called from the gunicorn master when PRELOAD_MODEL is set, so forked workers share
+    the weights copy-on-write instead of each holding their own copy.
+    """
+    try:
+        get_generator()
+        return True
+    except Exception:
+        return False
+
+
+def is_warm():
+    return _generator is not None
+
+
+def status():
+    return {
+        "model": MODEL_NAME,
+        "backend": BACKEND,
+        "warm": is_warm(),
+        "load_seconds": _load_seconds,
+        "error": _load_error,
+        "pid": os.getpid(),
+    }
+
+
+class _Request:
+    def __init__(self, text):
+        self.text = text
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingGenerator:
+    """
+    Collects prompts from concurrent callers for up to max_wait_ms (or until max_batch_size
+    prompts are waiting) and runs them through the pipeline as one padded batch.
+    Prompts are only batched with others that use the same generation kwargs.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._pending = {}  # generation kwargs -> list of _Request
+        self._cond = threading.Condition()
+        self._pid = None
+        metrics.gauge(
+            "generation.pending",
+            lambda: sum(len(reqs) for reqs in list(self._pending.values())),
+        )
+
+    def _ensure_started(self):
+        # Same fork rule as EventQueue: the scheduler thread belongs to the current process
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pending = {}
+            threading.Thread(
+                target=self._run, name="generation-batcher", daemon=True
+            ).start()
+            self._pid = os.getpid()
+
+    def generate(self, text, **kwargs):
+        """Blocking call returning the generated text for a single prompt."""
+        self._ensure_started()
+        request = _Request(text)
+        key = tuple(sorted(kwargs.items()))
+        with self._cond:
+            self._pending.setdefault(key, []).append(request)
+            self._cond.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _next_batch(self):
+        with self._cond:
+            while not any(self._pending.values()):
+                self._cond.wait()
+            # Serve the group whose oldest prompt has waited longest
+            key = min(
+                (k for k, reqs in self._pending.items() if reqs),
+                key=lambda k: self._pending[k][0].enqueued_at,
+            )
+            deadline = self._pending[key][0].enqueued_at + self.max_wait
+            while len(self._pending[key]) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[key][: self.max_batch_size]
+            del self._pending[key][: self.max_batch_size]
+            return dict(key), batch
+
+    def _run(self):
+        while True:
+            kwargs, batch = self._next_batch()
+            started = time.perf_counter()
+            for request in batch:
+                metrics.observe("generation.queue_wait", started - request.enqueued_at)
+            metrics.observe("generation.batch_size", len(batch), buckets=BATCH_SIZE_BUCKETS)
+            try:
+                generator = get_generator()
+                with metrics.timer("generation.batch_time"):
+                    outputs = generator(
+                        [request.text for request in batch],
+                        batch_size=len(batch),
+                        **kwargs,
+                    )
+                for request, output in zip(batch, outputs):
+                    # A list input yields one dict per prompt (or a one-element list of dicts)
+                    if isinstance(output, list):
+                        output = output[0]
+                    request.result = output["generated_text"]
+            except Exception as e:
+                logging.error(f"Batched generation of {len(batch)} prompts failed: {e}")
+                for request in batch:
+                    request.error = e
+            finally:
+                for request in batch:
+                    request.done.set()
+
+
+_batcher = BatchingGenerator() if MAX_BATCH_SIZE > 1 else None
+
+
+def generate(text, **kwargs):
+    """
+    Generate text for one prompt, sharing a batch with concurrent callers when batching is on.
+    """
+    if _batcher is None:
+        return get_generator()(text, **kwargs)[0]["generated_text"]
+    return _batcher.generate(text, **kwargs)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "export-onnx":
+        logging.basicConfig(
+            level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+        )
+        export_onnx(
+            sys.argv[2] if len(sys.argv) > 2 else MODEL_NAME,
+            sys.argv[3] if len(sys.argv) > 3 else "./bart-onnx",
+        )
+    else:
+        print("usage: python model_server.py export-onnx [model] [output_dir]")
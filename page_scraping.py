@@ -1,7 +1,10 @@
+import json
 import logging
 import os
+import queue
+import sys
+import threading
 import time
-import re
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from selenium import webdriver
@@ -15,12 +18,22 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
 from webdriver_manager.chrome import ChromeDriverManager
 from webdriver_manager.firefox import GeckoDriverManager
-from bs4 import BeautifulSoup
-from supabase import create_client, Client
 from cryptography.fernet import Fernet
 import ast
 from dotenv import load_dotenv
 import schedule
+import db
+from cache import fingerprint, rows_written
+import metrics
+from portal_dates import DATE_COLUMNS, date_fields
+from portal_http import (
+    LOGIN_URL,
+    MAIN_URL,
+    PortalSession,
+    parse_activities_html,
+    parse_assignments_html,
+)
+from scrape_scheduler import AdaptiveScheduler, parse_timestamp
 
 load_dotenv()
 
@@ -38,18 +51,23 @@ if not key:
 key_bytes = key.encode("utf-8")
 cypher = Fernet(key_bytes)
 
-# Initialize Supabase client
-supabase_url = os.environ.get(
-    "SUPABASE_URL", "https://opvnwapzljuxnncvpbrn.supabase.co"
-)
-supabase_key = os.environ.get("SUPABASE_KEY")
-if not supabase_key:
-    raise Exception("SUPABASE_KEY environment variable not set")
-supabase: Client = create_client(supabase_url, supabase_key)
-
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("WDM").setLevel(logging.WARNING)
 
+# Rows per bulk write request to Supabase
+WRITE_CHUNK_SIZE = int(os.environ.get("SCRAPE_WRITE_CHUNK_SIZE", 100))
+
+# Date columns added by the parsed-date migration in the README (end_datetime predates it).
+# Until the migration is run, rows are written without them.
+MIGRATED_DATE_COLUMNS = tuple(c for c in DATE_COLUMNS if c != "end_datetime")
+_write_date_columns = True
+
+# Natural key of each scraped table; needs a matching unique constraint (see README)
+NATURAL_KEYS = {
+    db.ASSIGNMENTS: ["UserID", "AssignmentName", "AssignmentDate"],
+    db.ACTIVITIES: ["UserID", "ActivityName", "ActivityDate"],
+}
+
 
 # Detect available browsers
 def detect_browser():
@@ -137,8 +155,7 @@ def initialize_driver():
 def attempt_login(driver, username, password):
     logging.info(f"Logging with {username}")
     try:
-        login_url = "https://portalx.yzu.edu.tw/PortalSocialVB/Login.aspx"
-        driver.get(login_url)
+        driver.get(LOGIN_URL)
         WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.ID, "Txt_UserID"))
         )
@@ -173,56 +190,73 @@ def attempt_login(driver, username, password):
         return False
 
 
-# Parse date string to timestamp
-def parse_date(date_str):
-    try:
-        end_part = date_str.split("~")[-1].strip()
-        if "." in end_part and ("下午" in end_part or "上午" in end_part):
-            match = re.match(
-                r"(\d{4}\.\d{2}\.\d{2}).*?(上午|下午)\s*(\d{2}:\d{2})", end_part
-            )
-            if not match:
-                raise ValueError(f"Invalid ActDate format: {end_part}")
-            date_str, period, time_str = match.groups()
-            date = datetime.strptime(f"{date_str} {time_str}", "%Y.%m.%d %H:%M")
-            if period == "下午" and date.hour < 12:
-                date = date.replace(hour=date.hour + 12)
-            elif period == "上午" and date.hour == 12:
-                date = date.replace(hour=0)
-            date = date.replace(tzinfo=timezone(timedelta(hours=8)))
-            return date.isoformat()
-        elif "/" in end_part:
-            date = datetime.strptime(end_part.strip(), "%Y/%m/%d %H:%M")
-            date = date.replace(tzinfo=timezone(timedelta(hours=8)))
-            return date.isoformat()
-        raise ValueError(f"Unknown date format: {end_part}")
-    except Exception as e:
-        logging.warning(f"Failed to parse date '{date_str}': {e}")
-        return None
-
-
 # Clean old records from Supabase
 def clean_old_records():
     try:
         current_time = datetime.now(timezone(timedelta(hours=8))).isoformat()
-        response = (
-            supabase.table("Activity table")
-            .delete()
-            .lt("end_datetime", current_time)
-            .execute()
-        )
-        logging.info(f"Deleted {len(response.data)} outdated activities.")
-        response = (
-            supabase.table("Assignment table")
-            .delete()
-            .lt("end_datetime", current_time)
-            .execute()
-        )
-        logging.info(f"Deleted {len(response.data)} outdated assignments.")
+        deleted = db.delete_ended_before(db.ACTIVITIES, current_time)
+        logging.info(f"Deleted {len(deleted)} outdated activities.")
+        deleted = db.delete_ended_before(db.ASSIGNMENTS, current_time)
+        logging.info(f"Deleted {len(deleted)} outdated assignments.")
     except Exception as e:
         logging.error(f"Failed to clean old records: {e}")
 
 
+# Leave the migrated date columns out of every later write, warning once
+def disable_date_columns(error):
+    global _write_date_columns
+    if _write_date_columns:
+        _write_date_columns = False
+        logging.warning(
+            f"Parsed date columns missing, writing rows without them "
+            f"(run the migration in the README, then backfill-dates): {error}"
+        )
+
+
+def without_date_columns(rows):
+    return [{k: v for k, v in row.items() if k not in MIGRATED_DATE_COLUMNS} for row in rows]
+
+
+# Write scraped rows in bulk, WRITE_CHUNK_SIZE rows per request.
+# Rows already stored under the same natural key are skipped by the database.
+# Returns False if any chunk failed.
+def write_rows(table_name, rows, student_id):
+    written = 0
+    ok = True
+    on_conflict = ",".join(NATURAL_KEYS[table_name])
+    for i in range(0, len(rows), WRITE_CHUNK_SIZE):
+        chunk = rows[i : i + WRITE_CHUNK_SIZE]
+        if not _write_date_columns:
+            chunk = without_date_columns(chunk)
+        start = time.perf_counter()
+        try:
+            try:
+                inserted = db.upsert_rows(table_name, chunk, on_conflict)
+            except Exception as e:
+                stripped = without_date_columns(chunk)
+                if not db.missing_column(e) or stripped == chunk:
+                    raise
+                disable_date_columns(e)
+                chunk = stripped
+                inserted = db.upsert_rows(table_name, chunk, on_conflict)
+        except Exception as e:
+            logging.warning(
+                f"Upsert of {len(chunk)} rows into {table_name} failed for {student_id}: {e}"
+            )
+            ok = False
+            continue
+        elapsed = time.perf_counter() - start
+        metrics.observe("scrape.write_time", elapsed)
+        # Only newly inserted rows are returned when duplicates are ignored
+        written += len(inserted)
+        logging.info(
+            f"Upserted {len(chunk)} rows into {table_name} for {student_id} "
+            f"({len(inserted)} new) in {elapsed * 1000:.0f} ms"
+        )
+    metrics.incr("scrape.rows_written", written)
+    return ok
+
+
 # Click element by ID
 def click_by_id(driver, element_id):
     try:
@@ -244,192 +278,614 @@ def click_by_id(driver, element_id):
         return False
 
 
-# Scrape activities
-def scrape_activities(driver, line_id, student_id):
-    try:
-        if not click_by_id(driver, "MainBar_ibnChangeVersion"):
-            return False
-        if not click_by_id(driver, "tdP4"):
-            return False
-        if not click_by_id(driver, "linkAlreadyRegistry"):
+# Scraper backend driving a real headless browser
+class SeleniumBackend:
+    name = "selenium"
+
+    def __init__(self):
+        self.driver = initialize_driver()
+
+    def login(self, username, password):
+        return attempt_login(self.driver, username, password)
+
+    def cookies(self):
+        return {c["name"]: c["value"] for c in self.driver.get_cookies()}
+
+    def resume(self, cookies):
+        try:
+            self.driver.delete_all_cookies()
+            # Cookies can only be added for the domain of the current page
+            self.driver.get(LOGIN_URL)
+            for name, value in cookies.items():
+                self.driver.add_cookie({"name": name, "value": value})
+            self.driver.get(MAIN_URL)
+            WebDriverWait(self.driver, 10).until(
+                lambda d: "MainBar_ibnChangeVersion" in d.page_source
+                or "Txt_UserID" in d.page_source
+            )
+            return "MainBar_ibnChangeVersion" in self.driver.page_source
+        except Exception as e:
+            logging.warning(f"Could not resume portal session: {e}")
             return False
-        WebDriverWait(driver, 10).until(
+
+    def assignments_html(self):
+        if not click_by_id(self.driver, "MainBar_ibnChangeVersion"):
+            raise Exception("Could not switch portal version")
+        WebDriverWait(self.driver, 15).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "#divTasks table"))
+        )
+        time.sleep(2)
+        return self.driver.page_source
+
+    def activities_html(self):
+        for element_id in ("MainBar_ibnChangeVersion", "tdP4", "linkAlreadyRegistry"):
+            if not click_by_id(self.driver, element_id):
+                raise Exception(f"Could not click {element_id}")
+        WebDriverWait(self.driver, 10).until(
             EC.presence_of_element_located((By.CLASS_NAME, "table_1"))
         )
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        table = soup.find("table", class_="table_1")
-        rows = table.find_all("tr")[1:]
-        logging.info(f"Activities found for {student_id}: {len(rows)}")
-        for row in rows:
-            cells = row.find_all("td")
-            subject = cells[1].find("a").get_text(strip=True)
-            date = cells[2].get_text(separator=" ", strip=True)
-            end_datetime = parse_date(date)
-            try:
-                data = {
-                    "LineID": line_id,
-                    "UserID": student_id,
-                    "ActivityName": subject,
-                    "ActivityDate": date,
-                    "end_datetime": end_datetime,
-                }
-                response = supabase.table("Activity table").insert(data).execute()
-                if response.data:
-                    logging.info(
-                        f"Inserted activity for {student_id}: {subject}, Date: {date}, End: {end_datetime}"
-                    )
-                else:
-                    logging.warning(f"Insert failed for {student_id}: {response}")
-            except Exception as e:
-                logging.warning(f"Insert failed for {student_id}: {e}")
-        return True
+        return self.driver.page_source
+
+    def settle(self):
+        WebDriverWait(self.driver, 5).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+
+    def close(self):
+        self.driver.quit()
+
+
+BACKENDS = {"selenium": SeleniumBackend, "http": PortalSession}
+SCRAPE_BACKEND = os.environ.get("SCRAPE_BACKEND", "selenium")
+# Run the asyncio HTTP pipeline (async_scraper.py) instead of the worker pool
+SCRAPE_ASYNC = os.environ.get("SCRAPE_ASYNC", "0").lower() in ("1", "true", "yes")
+# "fixed" scrapes everyone every 3 minutes; "adaptive" uses scrape_scheduler.AdaptiveScheduler
+SCRAPE_SCHEDULE = os.environ.get("SCRAPE_SCHEDULE", "fixed")
+
+
+def create_backend(name=None):
+    name = name or SCRAPE_BACKEND
+    if name not in BACKENDS:
+        raise Exception(f"Unknown scrape backend {name!r}, expected one of {list(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+# Fetch and parse the activities page; None when the table is missing or the fetch failed
+def fetch_activities(backend, student_id):
+    try:
+        activities = parse_activities_html(backend.activities_html())
+        if activities is None:
+            logging.warning("No table_1 found.")
+            return None
+        logging.info(f"Activities found for {student_id}: {len(activities)}")
+        return activities
     except Exception as e:
         logging.warning(f"Failed to scrape activities for {student_id}: {e}")
-        return False
+        return None
 
 
-# Scrape assignments
-def scrape_assignments(driver, line_id, student_id):
+# Fetch and parse the assignments page; None when divTasks is missing or the fetch failed
+def fetch_assignments(backend, student_id):
     try:
-        if not click_by_id(driver, "MainBar_ibnChangeVersion"):
-            return False
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "#divTasks table"))
-        )
-        time.sleep(2)
-        page_source = driver.page_source
-        try:
-            soup = BeautifulSoup(page_source, "lxml")
-        except:
-            soup = BeautifulSoup(page_source, "html.parser")
-        tasks_div = soup.find("div", id="divTasks")
-        if not tasks_div:
+        assignments = parse_assignments_html(backend.assignments_html())
+        if assignments is None:
             logging.warning("No tasks_div found.")
-            return False
-        tables = tasks_div.find_all("table")
-        assignments = []
-        for table in tables:
-            td = table.find("td", style="width:100%;")
-            if not td:
-                continue
-            title = (
-                td.find("a").get_text(strip=True) if td.find("a") else "Unknown Title"
-            )
-            time_range = table.find_next(string=lambda text: text and "時間：" in text)
-            time_range = (
-                time_range.replace("時間：", "").strip()
-                if time_range
-                else "No Time Range"
-            )
-            end_datetime = parse_date(time_range)
-            try:
-                data = {
-                    "LineID": line_id,
-                    "UserID": student_id,
-                    "AssignmentName": title,
-                    "AssignmentDate": time_range,
-                    "end_datetime": end_datetime,
-                }
-                response = supabase.table("Assignment table").insert(data).execute()
-                if response.data:
-                    logging.info(
-                        f"Inserted assignment for {student_id}: {title}, Duration: {time_range}, End: {end_datetime}"
-                    )
-                else:
-                    logging.warning(f"Insert failed for {student_id}: {response}")
-            except Exception as e:
-                logging.warning(f"Insert failed for {student_id}: {e}")
-        logging.info(f"Scraped assignments successfully for {student_id}.")
-        return True
+            return None
+        logging.info(f"Assignments found for {student_id}: {len(assignments)}")
+        return assignments
     except Exception as e:
         logging.warning(f"Failed to scrape assignments for {student_id}: {e}")
-        return False
+        return None
+
+
+# Content hash of one student's parsed divTasks / table_1 results
+def content_hash(assignments, activities):
+    return fingerprint(
+        [{"assignments": list(assignments)}, {"activities": list(activities)}]
+    )
+
+
+# Last stored content hash per LineID; seeded from the "ScrapeHash" column of "Login data"
+_scrape_hashes = {}
+_scrape_hashes_lock = threading.Lock()
+
+
+def stored_hash(student):
+    with _scrape_hashes_lock:
+        if "ScrapeHash" in student and student["ScrapeHash"] is None:
+            # Cleared in the table (or never stored): write again even if this process
+            # still remembers a hash
+            _scrape_hashes.pop(student["LineID"], None)
+            return None
+        return _scrape_hashes.get(student["LineID"]) or student.get("ScrapeHash")
+
+
+# LastScraped is rewritten at most this often for an unchanged student
+LAST_SCRAPED_INTERVAL = int(os.environ.get("SCRAPE_LAST_SCRAPED_INTERVAL", 300))
+_last_scraped = {}  # LineID -> when LastScraped was last written by this process
+
+
+# Record a finished scrape on "Login data": the new hash when the results changed, and
+# LastScraped (used by scrape_on_demand's staleness budget), in a single update
+def record_scrape(line_id, digest=None):
+    now = time.time()
+    update = {}
+    with _scrape_hashes_lock:
+        if digest is not None:
+            _scrape_hashes[line_id] = digest
+            update["ScrapeHash"] = digest
+        if update or now - _last_scraped.get(line_id, 0) >= LAST_SCRAPED_INTERVAL:
+            _last_scraped[line_id] = now
+            update["LastScraped"] = datetime.now(timezone.utc).isoformat()
+    if not update:
+        return
+    try:
+        db.update_login(line_id, update)
+    except Exception as e:
+        # The hash is still kept in memory, so only a restart re-writes this student's rows
+        logging.warning(f"Could not record scrape for {line_id}: {e}")
+
+
+# Compare freshly parsed results with the stored hash.
+# Returns (digest, unchanged); digest is None when a page failed, so it is never stored.
+def check_unchanged(student, assignments, activities):
+    if assignments is None or activities is None:
+        return None, False
+    digest = content_hash(assignments, activities)
+    return digest, digest == stored_hash(student)
+
+
+# Write one student's parsed results, then record the scrape and its hash
+def store_student(line_id, student_id, assignments, activities, digest):
+    ok = True
+    if assignments is not None:
+        ok = write_rows(
+            db.ASSIGNMENTS, assignment_rows(line_id, student_id, assignments), student_id
+        ) and ok
+    if activities is not None:
+        ok = write_rows(
+            db.ACTIVITIES, activity_rows(line_id, student_id, activities), student_id
+        ) and ok
+    # Drop cached replies built from this student's old rows
+    rows_written(line_id)
+    # Keep the hash only when every row was written, so failed chunks are retried next time
+    record_scrape(line_id, digest if ok else None)
 
 
 # delete duplicate data
 def deduplicate_table(table_name, unique_fields):
-    """Deduplicate a table based on unique fields, keeping the lowest id."""
+    """
+    Deduplicate a table based on unique fields, keeping the lowest id.
+    Only needed once for rows written before the natural-key upsert; see compact_tables().
+    """
     try:
-        response = supabase.table(table_name).select("*").execute()
-        if not response.data:
+        records = db.select_rows(table_name, ",".join(["id"] + unique_fields))
+        if not records:
             logging.info(f"No records in {table_name}.")
             return
-        records = response.data
         unique_records = {}
         for record in records:
             key = tuple(record[field] for field in unique_fields)
             unique_records.setdefault(key, []).append(record)
-        total_deleted = 0
+        duplicate_ids = []
         for key, duplicates in unique_records.items():
             if len(duplicates) > 1:
                 duplicates.sort(key=lambda x: x["id"])
-                for dup in duplicates[1:]:
-                    supabase.table(table_name).delete().eq("id", dup["id"]).execute()
-                    total_deleted += 1
-                    logging.info(f"Deleted duplicate in {table_name}: id={dup['id']}")
-        logging.info(f"Deleted {total_deleted} duplicates in {table_name}.")
+                duplicate_ids.extend(dup["id"] for dup in duplicates[1:])
+        for i in range(0, len(duplicate_ids), WRITE_CHUNK_SIZE):
+            chunk = duplicate_ids[i : i + WRITE_CHUNK_SIZE]
+            db.delete_ids(table_name, chunk)
+            logging.info(f"Deleted {len(chunk)} duplicates in {table_name}: ids={chunk}")
+        logging.info(f"Deleted {len(duplicate_ids)} duplicates in {table_name}.")
     except Exception as e:
         logging.error(f"Failed to deduplicate {table_name}: {e}")
 
 
-def main():
-    logging.info("Starting page_scraping.py execution...")
+# One-off cleanup of legacy duplicates: python page_scraping.py compact
+def compact_tables():
+    for table_name, unique_fields in NATURAL_KEYS.items():
+        deduplicate_table(table_name, unique_fields)
+
+
+# One-off fill of the parsed date columns for rows scraped before they existed:
+# python page_scraping.py backfill-dates. Rows sharing a date string are updated together.
+def backfill_date_columns():
+    for table_name, date_field, kind in (
+        (db.ASSIGNMENTS, "AssignmentDate", "assignment"),
+        (db.ACTIVITIES, "ActivityDate", "activity"),
+    ):
+        try:
+            # Every page is read before the first update, which takes rows out of the filter
+            rows = db.select_rows(table_name, date_field, null_column="display_date")
+            date_strings = {row[date_field] for row in rows}
+            for date_str in date_strings:
+                db.update_where(table_name, date_field, date_str, date_fields(date_str, kind))
+            logging.info(
+                f"Backfilled {len(rows)} rows in {table_name} "
+                f"({len(date_strings)} distinct dates)."
+            )
+        except Exception as e:
+            logging.error(f"Failed to backfill dates in {table_name}: {e}")
+
+
+# Decrypt the portal password stored in a "Login data" row
+def decrypt_password(student):
+    undecryptpassword = student["Ps"]
+    undecryptpassword = ast.literal_eval(undecryptpassword)
+    return cypher.decrypt(undecryptpassword).decode()
+
+
+# Build the Supabase rows for parsed (title, time range) assignments
+def assignment_rows(line_id, student_id, assignments):
+    return [
+        {
+            "LineID": line_id,
+            "UserID": student_id,
+            "AssignmentName": title,
+            "AssignmentDate": time_range,
+            **date_fields(time_range, "assignment"),
+        }
+        for title, time_range in assignments
+    ]
+
+
+# Build the Supabase rows for parsed (subject, date) activities
+def activity_rows(line_id, student_id, activities):
+    return [
+        {
+            "LineID": line_id,
+            "UserID": student_id,
+            "ActivityName": subject,
+            "ActivityDate": date,
+            **date_fields(date, "activity"),
+        }
+        for subject, date in activities
+    ]
+
+
+# Portal sessions older than this are not resumed (ASP.NET drops idle sessions after ~20 min)
+SESSION_MAX_AGE = int(os.environ.get("SCRAPE_SESSION_MAX_AGE", 1200))
+
+# Last saved portal session per LineID: encrypted token and when it was last known to work
+_sessions = {}
+_sessions_lock = threading.Lock()
+_login_stats = {"reused": 0, "fresh": 0, "fresh_seconds": 0.0}
+
+
+def session_reuse_rate():
+    with _sessions_lock:
+        total = _login_stats["reused"] + _login_stats["fresh"]
+        return _login_stats["reused"] / total if total else 0.0
+
+
+metrics.gauge("scrape.session_reuse_rate", session_reuse_rate)
+
+
+# Saved cookies for a student, or None when missing, unreadable or too old
+def load_session(student):
+    with _sessions_lock:
+        token, used_at = _sessions.get(student["LineID"], (student.get("Session"), None))
+    if not token:
+        return None
+    try:
+        payload = json.loads(cypher.decrypt(token.encode()).decode())
+    except Exception as e:
+        logging.warning(f"Discarding unreadable session for {student['StID']}: {e}")
+        return None
+    if time.time() - (used_at or payload.get("saved_at", 0)) > SESSION_MAX_AGE:
+        metrics.incr("scrape.session_expired")
+        return None
+    return payload.get("cookies")
+
+
+# Encrypt the portal cookies like the password and keep them on "Login data".Session
+def save_session(line_id, cookies):
+    payload = json.dumps({"cookies": cookies, "saved_at": time.time()})
+    token = cypher.encrypt(payload.encode()).decode()
+    with _sessions_lock:
+        _sessions[line_id] = (token, time.time())
+    try:
+        db.update_login(line_id, {"Session": token})
+    except Exception as e:
+        logging.warning(f"Could not store portal session for {line_id}: {e}")
+
+
+def forget_session(line_id):
+    with _sessions_lock:
+        _sessions[line_id] = (None, None)
+
+
+def session_resumed(line_id, elapsed):
+    with _sessions_lock:
+        token, _ = _sessions.get(line_id, (None, None))
+        if token:
+            # ASP.NET sessions slide: each use keeps it alive for another SESSION_MAX_AGE
+            _sessions[line_id] = (token, time.time())
+        _login_stats["reused"] += 1
+        fresh_mean = _login_stats["fresh_seconds"] / max(1, _login_stats["fresh"])
+    metrics.incr("scrape.session_reused")
+    metrics.observe("scrape.resume_time", elapsed)
+    if fresh_mean:
+        # Estimated against the mean fresh login measured in this process
+        metrics.incr("scrape.login_seconds_saved", max(0.0, fresh_mean - elapsed))
+
+
+def fresh_login_done(elapsed):
+    with _sessions_lock:
+        _login_stats["fresh"] += 1
+        _login_stats["fresh_seconds"] += elapsed
+    metrics.incr("scrape.fresh_login")
+    metrics.observe("scrape.login_time", elapsed)
+
+
+# Resume the student's saved portal session, or log in and save the new one
+def login_student(backend, student, password, max_attempts=3):
+    lineid = student["LineID"]
+    username = student["StID"]
+    cookies = load_session(student)
+    if cookies:
+        start = time.perf_counter()
+        if backend.resume(cookies):
+            logging.info(f"Resumed portal session for {username}.")
+            session_resumed(lineid, time.perf_counter() - start)
+            return True
+        logging.info(f"Saved session for {username} expired, logging in again.")
+        metrics.incr("scrape.session_expired")
+    for attempt in range(max_attempts):
+        start = time.perf_counter()
+        if backend.login(username, password):
+            fresh_login_done(time.perf_counter() - start)
+            save_session(lineid, backend.cookies())
+            return True
+        logging.warning(f"Retrying login for {username}...")
+    logging.warning(f"All login attempts failed for {username}.")
+    return False
+
+
+# Log in as one student and scrape both pages with the given backend.
+# Returns "changed", "unchanged" (nothing written) or "failed".
+def scrape_student(backend, student, max_attempts=3):
+    lineid = student["LineID"]
+    username = student["StID"]
+    password = decrypt_password(student)
+    logging.info(f"Processing student {username}...")
+    status = "failed"
+    if login_student(backend, student, password, max_attempts):
+        logging.info(f"Scraping assignments for {username}...")
+        assignments = fetch_assignments(backend, username)
+        logging.info(f"Scraping activities for {username}...")
+        activities = fetch_activities(backend, username)
+        digest, unchanged = check_unchanged(student, assignments, activities)
+        if assignments is None and activities is None:
+            # Possibly a session that died after resuming; log in afresh next time
+            forget_session(lineid)
+        elif unchanged:
+            logging.info(f"No changes for {username}, skipping writes.")
+            metrics.incr("scrape.unchanged")
+            status = "unchanged"
+            record_scrape(lineid)
+        else:
+            store_student(lineid, username, assignments, activities, digest)
+            metrics.incr("scrape.changed")
+            status = "changed"
     try:
-        driver = initialize_driver()
+        backend.settle()
+    except Exception as e:
+        logging.warning(f"Page did not settle after {username}: {e}")
+    return status
+
+
+# Number of scrape workers: SCRAPE_WORKERS, capped by free memory and by the number of students
+def worker_count(students):
+    requested = int(os.environ.get("SCRAPE_WORKERS", 2))
+    browser_mb = int(os.environ.get("SCRAPE_BROWSER_MEMORY_MB", 400))
+    if SCRAPE_BACKEND != "selenium":
+        # An HTTP session costs almost nothing compared to a browser
+        browser_mb = 20
+    try:
+        import psutil
+
+        by_memory = int(psutil.virtual_memory().available / (1024 * 1024) // browser_mb)
+    except Exception:
+        by_memory = requested
+    return max(1, min(requested, by_memory, len(students)))
+
+
+# Scrape every student with a pool of workers pulling from a shared queue.
+# Each worker owns its own browser or HTTP session, so cookies never leak between students.
+def run_cycle(students):
+    work = queue.Queue()
+    for student in students:
+        work.put(student)
+    timings = []  # (student id, seconds, status)
+    timings_lock = threading.Lock()
+
+    def worker(index):
         try:
-            clean_old_records()
-            response = supabase.table("Login data").select("LineID, StID, Ps").execute()
-            if not response.data:
-                raise Exception("No credentials found.")
-            student_credentials = response.data
-            max_attempts = 3
-            for student in student_credentials:
-                lineid = student["LineID"]
-                username = student["StID"]
-                undecryptpassword = student["Ps"]
-                undecryptpassword = ast.literal_eval(undecryptpassword)
-                password = cypher.decrypt(undecryptpassword).decode()
-                logging.info(f"Processing student {username}...")
-                for attempt in range(max_attempts):
-                    if attempt_login(driver, username, password):
-                        scrapers = {
-                            "assignments": lambda: scrape_assignments(
-                                driver, lineid, username
-                            ),
-                            "activities": lambda: scrape_activities(
-                                driver, lineid, username
-                            ),
-                        }
-                        for option, scraper in scrapers.items():
-                            logging.info(f"Scraping {option} for {username}...")
-                            scraper()
-                        # Deduplicate after scraping
-                        deduplicate_table(
-                            "Activity table", ["UserID", "ActivityName", "ActivityDate"]
-                        )
-                        deduplicate_table(
-                            "Assignment table",
-                            ["UserID", "AssignmentName", "AssignmentDate"],
-                        )
-                        break
-                    logging.warning(f"Retrying login for {username}...")
-                else:
-                    logging.warning(f"All login attempts failed for {username}.")
-                WebDriverWait(driver, 5).until(
-                    lambda d: d.execute_script("return document.readyState")
-                    == "complete"
-                )
+            backend = create_backend()
+        except Exception as e:
+            logging.error(f"Scrape worker {index} could not start its backend: {e}")
+            return
+        try:
+            while True:
+                try:
+                    student = work.get_nowait()
+                except queue.Empty:
+                    return
+                start = time.perf_counter()
+                try:
+                    status = scrape_student(backend, student)
+                except Exception as e:
+                    logging.error(f"Failed to scrape {student.get('StID')}: {e}")
+                    status = "failed"
+                elapsed = time.perf_counter() - start
+                metrics.observe("scrape.student_time", elapsed)
+                with timings_lock:
+                    timings.append((student.get("StID"), elapsed, status))
         finally:
-            logging.info("Closing browser...")
-            driver.quit()
+            logging.info(f"Scrape worker {index}: closing {backend.name} backend...")
+            backend.close()
+
+    workers = worker_count(students)
+    logging.info(
+        f"Scraping {len(students)} students with {workers} {SCRAPE_BACKEND} workers..."
+    )
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(i,), name=f"scrape-worker-{i}")
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    metrics.observe("scrape.cycle_time", duration)
+
+    summary = cycle_summary(duration, workers, students, timings, skipped=work.qsize())
+    logging.info(
+        f"Scrape cycle finished in {duration:.1f}s with {workers} workers: "
+        f"{summary['succeeded']} succeeded ({summary['unchanged']} unchanged), "
+        f"{summary['failed']} failed, {summary['skipped']} not reached"
+    )
+    log_timings(timings)
+    return summary
+
+
+# Per-cycle totals shared by the thread pool and the async pipeline
+def cycle_summary(duration, workers, students, timings, skipped=0):
+    unchanged = sum(1 for _, _, status in timings if status == "unchanged")
+    metrics.gauge("scrape.last_cycle_unchanged", unchanged)
+    return {
+        "duration": duration,
+        "workers": workers,
+        "students": len(students),
+        "succeeded": sum(1 for _, _, status in timings if status != "failed"),
+        "unchanged": unchanged,
+        "failed": sum(1 for _, _, status in timings if status == "failed"),
+        "skipped": skipped,
+        "timings": timings,
+    }
+
+
+def log_timings(timings):
+    for student_id, elapsed, status in sorted(timings, key=lambda t: -t[1]):
+        note = "" if status == "changed" else f" ({status})"
+        logging.info(f"  {student_id}: {elapsed:.1f}s{note}")
+
+
+# Credentials plus scraper state; older tables without the ScrapeHash / LastActive /
+# LastScraped / Session columns still work
+def load_students():
+    try:
+        return db.list_logins("LineID, StID, Ps, ScrapeHash, LastActive, LastScraped, Session")
+    except Exception as e:
+        logging.warning(f"Could not read scraper state columns, using credentials only: {e}")
+        return db.list_logins("LineID, StID, Ps")
+
+
+# Nearest upcoming end_datetime per LineID across both tables, for the adaptive schedule
+def upcoming_deadlines(line_ids):
+    current_time = datetime.now(timezone(timedelta(hours=8))).isoformat()
+    line_ids = list(line_ids)
+    nearest = {}
+    for table_name in NATURAL_KEYS:
+        for i in range(0, len(line_ids), WRITE_CHUNK_SIZE):
+            try:
+                rows = db.upcoming_rows(
+                    table_name,
+                    "LineID, end_datetime",
+                    current_time,
+                    line_ids=line_ids[i : i + WRITE_CHUNK_SIZE],
+                    name="deadlines",
+                )
+            except Exception as e:
+                logging.warning(f"Failed to read deadlines from {table_name}: {e}")
+                continue
+            for row in rows:
+                end = parse_timestamp(row.get("end_datetime"))
+                if end and (row["LineID"] not in nearest or end < nearest[row["LineID"]]):
+                    nearest[row["LineID"]] = end
+    return nearest
+
+
+def main():
+    logging.info("Starting page_scraping.py execution...")
+    try:
+        clean_old_records()
+        students = load_students()
+        if not students:
+            raise Exception("No credentials found.")
+        if SCRAPE_ASYNC:
+            import asyncio
+            from async_scraper import run_cycle_async
+
+            asyncio.run(run_cycle_async(students))
+        else:
+            run_cycle(students)
         logging.info("Scheduler started, running every 3 minutes.")
     except Exception as e:
         logging.error(f"Error in page_scraping.py: {e}")
 
 
-if __name__ == "__main__":
+# Command line: python page_scraping.py [run|compact|backfill-dates] [--backend ...]
+def cli():
+    global SCRAPE_BACKEND, SCRAPE_ASYNC
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Scrape the YZU portal into Supabase.")
+    arg_parser.add_argument(
+        "command", nargs="?", choices=["run", "compact", "backfill-dates"], default="run"
+    )
+    arg_parser.add_argument("--backend", choices=list(BACKENDS), default=SCRAPE_BACKEND)
+    arg_parser.add_argument(
+        "--schedule",
+        choices=["fixed", "adaptive"],
+        default=SCRAPE_SCHEDULE,
+        help="fixed: everyone every 3 minutes; adaptive: per-student intervals",
+    )
+    arg_parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        default=SCRAPE_ASYNC,
+        help="use the asyncio HTTP pipeline",
+    )
+    args = arg_parser.parse_args()
+    SCRAPE_BACKEND = args.backend
+    SCRAPE_ASYNC = args.use_async
+    if args.command == "compact":
+        compact_tables()
+        sys.exit(0)
+    if args.command == "backfill-dates":
+        backfill_date_columns()
+        sys.exit(0)
+    if args.schedule == "adaptive":
+        clean_old_records()
+        schedule.every(3).minutes.do(clean_old_records)
+
+        def scheduled_cycle(students):
+            # clean_old_records keeps its 3-minute schedule between cycles
+            schedule.run_pending()
+            if SCRAPE_ASYNC:
+                import asyncio
+                from async_scraper import run_cycle_async
+
+                return asyncio.run(run_cycle_async(students))
+            return run_cycle(students)
+
+        AdaptiveScheduler(load_students, scheduled_cycle, upcoming_deadlines).run_forever()
     main()
     schedule.every(3).minutes.do(main)
     while True:
         schedule.run_pending()
         time.sleep(1)
+
+
+if __name__ == "__main__":
+    # Run cli() on the importable page_scraping module, not on __main__: async_scraper and
+    # scrape_on_demand import page_scraping, and a second copy of this module would have its
+    # own SCRAPE_BACKEND, hash cache and session state
+    import page_scraping
+
+    page_scraping.cli()
@@ -0,0 +1,84 @@
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+
+# Portal times are Taiwan time
+TAIPEI = timezone(timedelta(hours=8))
+
+# One end of a portal time range, e.g. "2025/06/13 23:59" (assignments) or
+# "2025.05.29(四) 下午 06:00" (activities, 12-hour clock with 上午/下午)
+_POINT_RE = re.compile(
+    r"(\d{4})[./](\d{2})[./](\d{2}).*?(上午|下午)?\s*(\d{1,2}):(\d{2})"
+)
+
+# Columns the scraper stores next to the raw date string, so replies need no parsing
+DATE_COLUMNS = (
+    "start_datetime",
+    "end_datetime",
+    "weekday",
+    "display_date",
+    "start_time",
+    "end_time",
+)
+
+
+def parse_point(text):
+    match = _POINT_RE.search(text)
+    if not match:
+        return None
+    year, month, day, period, hour, minute = match.groups()
+    hour = int(hour)
+    # Convert to 24-hour format
+    if period == "下午" and hour < 12:
+        hour += 12
+    elif period == "上午" and hour == 12:
+        hour = 0
+    return datetime(int(year), int(month), int(day), hour, int(minute), tzinfo=TAIPEI)
+
+
+def parse_range(date_str):
+    """Return (start, end) datetimes of a "start ~ end" portal string; either may be None."""
+    parts = (date_str or "").split("~")
+    start = parse_point(parts[0]) if len(parts) > 1 else None
+    end = parse_point(parts[-1])
+    return start, end
+
+
+def date_fields(date_str, kind):
+    """
+    Parse an AssignmentDate / ActivityDate string into the DATE_COLUMNS values.
+    Assignments are shown by their deadline (the end of the range), activities by their
+    start. All values are None when the string cannot be parsed.
+    """
+    start, end = parse_range(date_str)
+    if kind == "activity" and start is None:
+        # Activities listed with a single time, not a range
+        start = end
+    shown = end if kind == "assignment" else start
+    if end is None or shown is None:
+        logging.warning(f"Failed to parse {kind} date '{date_str}'")
+        return dict.fromkeys(DATE_COLUMNS)
+    return {
+        "start_datetime": start.isoformat() if start else None,
+        "end_datetime": end.isoformat(),
+        "weekday": shown.strftime("%A"),
+        "display_date": shown.strftime("%Y-%m-%d"),
+        "start_time": start.strftime("%H:%M") if start else None,
+        "end_time": end.strftime("%H:%M"),
+    }
+
+
+def date_info(fields, kind, include_day=True):
+    """
+    Reply-ready date components from DATE_COLUMNS values, in the shape the reply templates use:
+    assignments {'day', 'date', 'time'}, activities {'day', 'date', 'start_time', 'end_time'}.
+    """
+    day = fields["weekday"] if include_day else ""
+    if kind == "assignment":
+        return {"day": day, "date": fields["display_date"], "time": fields["end_time"]}
+    return {
+        "day": day,
+        "date": fields["display_date"],
+        "start_time": fields["start_time"],
+        "end_time": fields["end_time"],
+    }
@@ -0,0 +1,205 @@
+import argparse
+import html
+import logging
+import secrets
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for the YZU portal pages the scraper touches, for offline runs and benchmarks:
+#   python portal_fixture_server.py --port 8765
+#   PORTAL_BASE_URL=http://127.0.0.1:8765/PortalSocialVB/ python page_scraping.py --backend http
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+PREFIX = "/PortalSocialVB/"
+WEEKDAYS_ZH = "一二三四五六日"
+
+USERS = {}
+SESSIONS = {}  # session id -> {"user": ..., "chinese": bool}
+
+
+def assignment_range(days):
+    start = datetime.now() - timedelta(days=1)
+    end = datetime.now() + timedelta(days=days)
+    return f"{start:%Y/%m/%d %H:%M} ~ {end:%Y/%m/%d} 23:59"
+
+
+def activity_range(days, start_hour):
+    day = datetime.now() + timedelta(days=days)
+    label = f"{day:%Y.%m.%d}({WEEKDAYS_ZH[day.weekday()]})"
+    period = "下午" if start_hour >= 12 else "上午"
+    hour = start_hour - 12 if start_hour > 12 else start_hour
+    return f"{label} {period} {hour:02d}:00 ~ {label} {period} {hour + 2:02d}:00"
+
+
+def assignments():
+    return [
+        ("【作業】[演算法概論IN208] Dynamic Programming", assignment_range(2)),
+        ("【作業】[資訊隱私IN211] Appreciation report", assignment_range(6)),
+    ]
+
+
+def activities():
+    return [
+        ("國際校友系列講座I - 留台發展指南", activity_range(3, 14)),
+        ("元智大學EMI聯合成果展", activity_range(5, 18)),
+    ]
+
+
+def page(body, viewstate=True):
+    hidden = ""
+    if viewstate:
+        hidden = (
+            f'<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{secrets.token_hex(16)}">'
+            '<input type="hidden" name="__VIEWSTATEGENERATOR" value="C2EE9ABB">'
+            '<input type="hidden" name="__EVENTVALIDATION" value="fixture">'
+            '<input type="hidden" name="__EVENTTARGET" value="">'
+            '<input type="hidden" name="__EVENTARGUMENT" value="">'
+        )
+    return (
+        "<html><head><meta charset='utf-8'><script>"
+        "function __doPostBack(t,a){var f=document.forms[0];"
+        "f.__EVENTTARGET.value=t;f.__EVENTARGUMENT.value=a;f.submit();}"
+        f"</script></head><body><form method='post' action=''>{hidden}{body}</form></body></html>"
+    )
+
+
+def login_page(error=None):
+    alert = f"<script>alert('{error}');</script>" if error else ""
+    return page(
+        alert
+        + '<input name="Txt_UserID" id="Txt_UserID" type="text">'
+        + '<input name="Txt_Password" id="Txt_Password" type="password">'
+        + '<input name="ibnSubmit" id="ibnSubmit" type="image" src="images/login.png">'
+    )
+
+
+def main_bar(session):
+    if session["chinese"]:
+        toggle = 'title="中文版" src="images/VersionEN.png"'
+    else:
+        toggle = 'title="English Version" src="images/VersionCH.png"'
+    return (
+        f'<input type="image" name="MainBar$ibnChangeVersion" id="MainBar_ibnChangeVersion" {toggle}>'
+        '<table><tr><td id="tdP4" onclick="location.href=\'Activity.aspx\'">活動</td></tr></table>'
+    )
+
+
+def main_page(session):
+    tasks = ""
+    if session["chinese"]:
+        for title, time_range in assignments():
+            tasks += (
+                '<table><tr><td style="width:100%;">'
+                f'<a href="#">{html.escape(title)}</a></td></tr></table>'
+                f"<span>時間：{time_range}</span>"
+            )
+    return page(main_bar(session) + f'<div id="divTasks">{tasks}</div>')
+
+
+def activity_menu(session):
+    return page(
+        main_bar(session)
+        + "<a id=\"linkAlreadyRegistry\" href=\"javascript:__doPostBack('linkAlreadyRegistry','')\">已報名</a>"
+    )
+
+
+def activity_table(session):
+    rows = "".join(
+        f"<tr><td>{i + 1}</td><td><a href='#'>{html.escape(name)}</a></td>"
+        f"<td>{date.replace(' ~ ', '<br>~ ')}</td></tr>"
+        for i, (name, date) in enumerate(activities())
+    )
+    return page(
+        main_bar(session)
+        + f'<table class="table_1"><tr><th>#</th><th>活動</th><th>時間</th></tr>{rows}</table>'
+    )
+
+
+class PortalHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def send_html(self, body, cookie=None, status=200):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if cookie:
+            self.send_header("Set-Cookie", f"ASP.NET_SessionId={cookie}; Path=/; HttpOnly")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def redirect(self, location, cookie=None):
+        self.send_response(302)
+        self.send_header("Location", location)
+        if cookie:
+            self.send_header("Set-Cookie", f"ASP.NET_SessionId={cookie}; Path=/; HttpOnly")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def session(self):
+        for part in self.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "ASP.NET_SessionId" and value in SESSIONS:
+                return SESSIONS[value]
+        return None
+
+    def form(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = parse_qs(self.rfile.read(length).decode("utf-8"))
+        return {key: values[0] for key, values in data.items()}
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == PREFIX + "Login.aspx":
+            return self.send_html(login_page())
+        session = self.session()
+        if session is None:
+            return self.redirect(PREFIX + "Login.aspx")
+        if path == PREFIX + "Default.aspx":
+            return self.send_html(main_page(session))
+        if path == PREFIX + "Activity.aspx":
+            return self.send_html(activity_menu(session))
+        self.send_html("<html><body>Not found</body></html>", status=404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        data = self.form()
+        if "__VIEWSTATE" not in data:
+            return self.send_html("<html><body>Invalid postback</body></html>", status=500)
+        if path == PREFIX + "Login.aspx":
+            user = data.get("Txt_UserID")
+            if "ibnSubmit.x" not in data or USERS.get(user) != data.get("Txt_Password"):
+                return self.send_html(login_page("Login Failed"))
+            session_id = secrets.token_hex(12)
+            SESSIONS[session_id] = {"user": user, "chinese": False}
+            return self.redirect(PREFIX + "Default.aspx", cookie=session_id)
+        session = self.session()
+        if session is None:
+            return self.redirect(PREFIX + "Login.aspx")
+        if "MainBar$ibnChangeVersion.x" in data:
+            session["chinese"] = not session["chinese"]
+        if data.get("__EVENTTARGET") == "linkAlreadyRegistry":
+            return self.send_html(activity_table(session))
+        if path == PREFIX + "Activity.aspx":
+            return self.send_html(activity_menu(session))
+        return self.send_html(main_page(session))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fixture YZU portal pages.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--user", default="s1234567")
+    parser.add_argument("--password", default="password")
+    args = parser.parse_args()
+    USERS[args.user] = args.password
+    server = ThreadingHTTPServer((args.host, args.port), PortalHandler)
+    logging.info(f"Fixture portal on http://{args.host}:{args.port}{PREFIX}Login.aspx")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
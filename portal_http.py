@@ -0,0 +1,311 @@
+import logging
+import os
+import re
+from urllib.parse import urljoin
+
+import httpx
+from bs4 import BeautifulSoup
+
+PORTAL_BASE_URL = os.environ.get(
+    "PORTAL_BASE_URL", "https://portalx.yzu.edu.tw/PortalSocialVB/"
+)
+LOGIN_URL = urljoin(PORTAL_BASE_URL, "Login.aspx")
+MAIN_URL = urljoin(PORTAL_BASE_URL, "Default.aspx")
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36"
+
+_POSTBACK_RE = re.compile(r"__doPostBack\(\s*'([^']*)'\s*,\s*'([^']*)'\s*\)")
+_ONCLICK_URL_RE = re.compile(
+    r"(?:location(?:\.href)?\s*=|window\.open\(|location\.replace\()\s*['\"]([^'\"]+)['\"]"
+)
+
+
+def make_soup(html):
+    try:
+        return BeautifulSoup(html, "lxml")
+    except Exception:
+        return BeautifulSoup(html, "html.parser")
+
+
+def form_fields(form):
+    """
+    Collect the values an ASP.NET page posts back by default: hidden fields (__VIEWSTATE,
+    __EVENTVALIDATION, ...), text inputs and selected options. Buttons are left out;
+    the caller adds the one that was "clicked".
+    """
+    fields = {}
+    for field in form.find_all("input"):
+        name = field.get("name")
+        field_type = (field.get("type") or "text").lower()
+        if not name or field_type in ("submit", "image", "button", "reset", "file"):
+            continue
+        if field_type in ("checkbox", "radio") and not field.has_attr("checked"):
+            continue
+        fields[name] = field.get("value", "")
+    for select in form.find_all("select"):
+        name = select.get("name")
+        option = select.find("option", selected=True) or select.find("option")
+        if name and option is not None:
+            fields[name] = option.get("value", option.get_text())
+    return fields
+
+
+def submit_request(soup, url, extra):
+    """Build the POST an ASP.NET form submission would send, as (method, url, data)."""
+    form = soup.find("form")
+    if form is None:
+        raise Exception(f"No form on {url}")
+    data = form_fields(form)
+    data.update(extra)
+    return "POST", urljoin(url, form.get("action") or url), data
+
+
+def click_request(html, url, element_id):
+    """
+    Work out what clicking the element in a browser would send: a postback for an image/submit
+    button or __doPostBack link, or a GET for a plain link / onclick navigation.
+    """
+    soup = make_soup(html)
+    element = soup.find(id=element_id)
+    if element is None:
+        raise Exception(f"Element {element_id} not found on {url}")
+    name = element.get("name") or element_id
+    element_type = (element.get("type") or "").lower()
+    if element.name == "input" and element_type == "image":
+        return submit_request(soup, url, {f"{name}.x": "1", f"{name}.y": "1"})
+    if element.name in ("input", "button") and element_type in ("submit", "button", ""):
+        return submit_request(soup, url, {name: element.get("value", "")})
+    script = f"{element.get('href', '')} {element.get('onclick', '')}"
+    postback = _POSTBACK_RE.search(script)
+    if postback:
+        target, argument = postback.groups()
+        return submit_request(
+            soup, url, {"__EVENTTARGET": target, "__EVENTARGUMENT": argument}
+        )
+    navigation = _ONCLICK_URL_RE.search(element.get("onclick", ""))
+    if navigation:
+        return "GET", urljoin(url, navigation.group(1)), None
+    href = element.get("href")
+    if href and not href.startswith("javascript:") and href != "#":
+        return "GET", urljoin(url, href), None
+    raise Exception(f"Don't know how to click {element_id} on {url}")
+
+
+def login_request(html, url, username, password):
+    soup = make_soup(html)
+
+    # ASP.NET names can differ from ids inside naming containers
+    def field_name(element_id):
+        element = soup.find(id=element_id)
+        return element.get("name", element_id) if element else element_id
+
+    button = soup.find(id="ibnSubmit")
+    button_name = field_name("ibnSubmit")
+    extra = {field_name("Txt_UserID"): username, field_name("Txt_Password"): password}
+    if button is not None and (button.get("type") or "").lower() == "image":
+        extra.update({f"{button_name}.x": "1", f"{button_name}.y": "1"})
+    else:
+        extra[button_name] = button.get("value", "") if button else ""
+    return submit_request(soup, url, extra)
+
+
+def login_result(html):
+    """Return (success, failure reason) for the page shown after submitting the login form."""
+    if "MainBar_ibnChangeVersion" in html and "Login Failed" not in html:
+        return True, None
+    alert = re.search(r"alert\(\s*['\"]([^'\"]*)['\"]", html)
+    return False, alert.group(1) if alert else "no portal main page"
+
+
+def needs_version_toggle(html):
+    # Same rule as page_scraping.click_by_id: only toggle when the page is not already
+    # showing the version the parsers expect
+    element = make_soup(html).find(id="MainBar_ibnChangeVersion")
+    if element is None:
+        raise Exception("Language toggle not found; is the session logged in?")
+    title = element.get("title") or ""
+    src = element.get("src") or ""
+    return not ("中文" in title or "VersionEN.png" in src)
+
+
+# Parse the "已報名" activities table into (subject, date) pairs
+def parse_activities_html(html):
+    soup = make_soup(html)
+    table = soup.find("table", class_="table_1")
+    if not table:
+        return None
+    activities = []
+    for row in table.find_all("tr")[1:]:
+        cells = row.find_all("td")
+        subject = cells[1].find("a").get_text(strip=True)
+        date = cells[2].get_text(separator=" ", strip=True)
+        activities.append((subject, date))
+    return activities
+
+
+# Parse the divTasks block of the portal main page into (title, time range) pairs
+def parse_assignments_html(html):
+    soup = make_soup(html)
+    tasks_div = soup.find("div", id="divTasks")
+    if not tasks_div:
+        return None
+    assignments = []
+    for table in tasks_div.find_all("table"):
+        td = table.find("td", style="width:100%;")
+        if not td:
+            continue
+        title = td.find("a").get_text(strip=True) if td.find("a") else "Unknown Title"
+        time_range = table.find_next(string=lambda text: text and "時間：" in text)
+        time_range = (
+            time_range.replace("時間：", "").strip() if time_range else "No Time Range"
+        )
+        assignments.append((title, time_range))
+    return assignments
+
+
+class PortalSession:
+    """
+    Browser-free client for the YZU portal: ASP.NET forms are posted directly with httpx and
+    the same pages the Selenium path renders are returned as HTML.
+    Exposes the scraper backend interface (login / resume / cookies / assignments_html /
+    activities_html / close).
+    Each instance has its own cookie jar; pass a shared `transport` to reuse pooled connections.
+    """
+
+    name = "http"
+
+    def __init__(self, transport=None, timeout=15):
+        self.client = httpx.Client(
+            transport=transport,
+            timeout=timeout,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+        )
+        self.url = None
+        self.html = None
+
+    def _send(self, method, url, data=None):
+        response = self.client.request(method, url, data=data)
+        response.raise_for_status()
+        self.url, self.html = str(response.url), response.text
+        return self.html
+
+    def click(self, element_id):
+        return self._send(*click_request(self.html, self.url, element_id))
+
+    def login(self, username, password):
+        logging.info(f"Logging with {username} (http)")
+        try:
+            self.client.cookies.clear()
+            self._send("GET", LOGIN_URL)
+            html = self._send(*login_request(self.html, self.url, username, password))
+            success, reason = login_result(html)
+            if success:
+                logging.info(f"Login successful for {username}!")
+                return True
+            logging.warning(f"Login failed for {username}: {reason}")
+            return False
+        except Exception as e:
+            logging.warning(f"Login failed for {username}: {e}")
+            return False
+
+    def cookies(self):
+        return dict(self.client.cookies)
+
+    def resume(self, cookies):
+        """Open the main page with saved cookies instead of logging in. True if still valid."""
+        try:
+            self.client.cookies.clear()
+            for name, value in cookies.items():
+                self.client.cookies.set(name, value)
+            return login_result(self._send("GET", MAIN_URL))[0]
+        except Exception as e:
+            logging.warning(f"Could not resume portal session: {e}")
+            return False
+
+    def ensure_version(self):
+        if needs_version_toggle(self.html):
+            return self.click("MainBar_ibnChangeVersion")
+        return self.html
+
+    def assignments_html(self):
+        return self.ensure_version()
+
+    def activities_html(self):
+        self.ensure_version()
+        self.click("tdP4")
+        return self.click("linkAlreadyRegistry")
+
+    def settle(self):
+        pass
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncPortalSession:
+    """
+    asyncio twin of PortalSession for the concurrent scrape pipeline (async_scraper.py).
+    Sessions built on the same AsyncHTTPTransport share its keep-alive connection pool
+    while keeping separate cookie jars.
+    """
+
+    def __init__(self, transport, timeout=15):
+        self.client = httpx.AsyncClient(
+            transport=transport,
+            timeout=timeout,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+        )
+        self.url = None
+        self.html = None
+
+    async def _send(self, method, url, data=None):
+        response = await self.client.request(method, url, data=data)
+        response.raise_for_status()
+        self.url, self.html = str(response.url), response.text
+        return self.html
+
+    async def click(self, element_id):
+        return await self._send(*click_request(self.html, self.url, element_id))
+
+    async def login(self, username, password):
+        logging.info(f"Logging with {username} (async http)")
+        try:
+            self.client.cookies.clear()
+            await self._send("GET", LOGIN_URL)
+            html = await self._send(*login_request(self.html, self.url, username, password))
+            success, reason = login_result(html)
+            if success:
+                logging.info(f"Login successful for {username}!")
+                return True
+            logging.warning(f"Login failed for {username}: {reason}")
+            return False
+        except Exception as e:
+            logging.warning(f"Login failed for {username}: {e}")
+            return False
+
+    def cookies(self):
+        return dict(self.client.cookies)
+
+    async def resume(self, cookies):
+        try:
+            self.client.cookies.clear()
+            for name, value in cookies.items():
+                self.client.cookies.set(name, value)
+            return login_result(await self._send("GET", MAIN_URL))[0]
+        except Exception as e:
+            logging.warning(f"Could not resume portal session: {e}")
+            return False
+
+    async def ensure_version(self):
+        if needs_version_toggle(self.html):
+            return await self.click("MainBar_ibnChangeVersion")
+        return self.html
+
+    async def assignments_html(self):
+        return await self.ensure_version()
+
+    async def activities_html(self):
+        await self.ensure_version()
+        await self.click("tdP4")
+        return await self.click("linkAlreadyRegistry")
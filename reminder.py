@@ -1,125 +1,241 @@
 import schedule as s
 from datetime import datetime, timedelta, timezone
+import heapq
+import itertools
 import time
 import threading
+import logging
 import app
 import os
-import schedule
-from supabase import create_client, Client
+import db
+import metrics
+from cache import on_rows_written
+from delivery import deliver
+from scrape_scheduler import parse_timestamp
 from flask import Flask, request, abort
 from linebot.v3 import (
     WebhookParser
 )
-from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    TextMessage,
-    PushMessageRequest
-)
-
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
 
-configuration = Configuration(access_token=os.getenv("CHANNEL_ACCESS_TOKEN"))
-api_client = ApiClient(configuration=configuration)
-line_bot_api = MessagingApi(api_client=api_client)
 parser = WebhookParser(channel_secret=os.getenv("CHANNEL_SECRET"))
 
 
-# Checker for activities
-def assignmentchecker():
-    now_utc = datetime.now(timezone.utc)
-
-    response = (
-        supabase.table("Assignment table")
-        .select("LineID", "Assignment Name", "end_datetime", "flag3", "flag1")
-        .execute()
-    )
-
-    push_text = ""
-    for entry in response.data:
-        if entry["flag3"] == None and entry["end_datetime"].date() == (now_utc + timedelta(days=3)).date(): # AND the time is less than three days
-            push_text = f"You have the assignment ({entry["Assignment_Name"]}) due in 3 days"
-            response = (
-                supabase.table("Assignment table")
-                .update({"flag3": 1})
-                .eq("id", entry["id"])
-                .execute()
-            )
-        elif entry["flag1"] == None and entry["end_datetime"].date() == (now_utc + timedelta(days=1)).date(): # AND the time is less than a day
-            push_text = f"You have the assignment ({entry["Assignment_Name"]}) due in 1 day"
-            response = (
-                supabase.table("Assignment table")
-                .update({"flag1": 1})
-                .eq("id", entry["id"])
-                .execute()
-            )
-        else:
-            continue
-
-        if push_text != None:
-            push_request = PushMessageRequest(
-            to = entry["LineID"],
-            messages = [TextMessage(text = push_text)]
-            ) 
-
-            line_bot_api.push_message(push_request)
-            app.logger.info(f"Successfully sent: '{push_text}'")
-
-# Checker for activities
-def activitieschecker(): 
-    now_utc = datetime.now(timezone.utc)
-
-    response = (
-        supabase.table("Activities table")
-        .select("id", "LineID", "Activity Name", "end_datetime", "flag3", "flag1")
-        .execute()
-    )
-
-    for entry in response.data:
-        push_text = ""
-        if entry["flag3"] == None and entry["end_datetime"].date() == (now_utc + timedelta(days=3)).date(): # AND the time is less than three days
-            push_text = f"You have the activity ({entry["Activities_Name"]}) due in 3 days"
-            response = (
-                supabase.table("Activities table")
-                .update({"flag3": 1})
-                .eq("id", entry["id"])
-                .execute()
-            )
-        elif entry["flag1"] == None and entry["end_datetime"].date() == (now_utc + timedelta(days=1)).date(): # AND the time is less than a day
-            push_text = f"You have the activity ({entry["Activities_Name"]}) due in 1 day"
-            response = (
-                supabase.table("Activities table")
-                .update({"flag1": 1})
-                .eq("id", entry["id"])
-                .execute()
-            )
-        else:
-            continue
-        
-        if push_text:
-            push_request = PushMessageRequest(
-            to = entry["LineID"],
-            messages = [TextMessage(text = push_text)]
+def parse_lead_time(text):
+    """
+    "3d" -> (3 days, "flag3", "3 days"); "2h" -> (2 hours, "flag2h", "2 hours").
+    Each lead time needs its own smallint flag column on both tables (flag1 and flag3 exist).
+    """
+    text = text.strip().lower()
+    amount = int(text[:-1])
+    plural = "s" if amount != 1 else ""
+    if text.endswith("d"):
+        return timedelta(days=amount), f"flag{amount}", f"{amount} day{plural}"
+    if text.endswith("h"):
+        return timedelta(hours=amount), f"flag{amount}h", f"{amount} hour{plural}"
+    raise ValueError(f"Lead time must look like 3d or 2h, got {text!r}")
+
+
+def remaining_label(left):
+    # "2 days 5 hours", "5 hours", "40 minutes": same wording as the lead time labels
+    def part(amount, unit):
+        return f"{amount} {unit}{'s' if amount != 1 else ''}"
+
+    minutes = max(1, int(left.total_seconds() // 60))
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return part(days, "day") + (f" {part(hours, 'hour')}" if hours else "")
+    if hours:
+        return part(hours, "hour")
+    return part(minutes, "minute")
+
+
+# How long before end_datetime reminders are sent, nearest first
+LEAD_TIMES = sorted(
+    parse_lead_time(t)
+    for t in os.getenv("REMINDER_LEAD_TIMES", "1d,3d").split(",")
+    if t.strip()
+)
+# Seconds between checks for rows the scraper added since the last load
+REMINDER_REFRESH_INTERVAL = int(os.getenv("REMINDER_REFRESH_INTERVAL", 60))
+# Seconds between full reloads, which also pick up flag changes made elsewhere
+REMINDER_RELOAD_INTERVAL = int(os.getenv("REMINDER_RELOAD_INTERVAL", 3600))
+# Seconds before a reminder that could not be delivered is tried again
+REMINDER_RETRY_DELAY = int(os.getenv("REMINDER_RETRY_DELAY", 60))
+# A reminder sent more than this many seconds after its fire time (a row scraped inside the
+# lead time, a restart, a retry) states the time actually left instead of the lead time
+REMINDER_LATE_GRACE = int(os.getenv("REMINDER_LATE_GRACE", 300))
+
+# table -> (name column, kind used in the message)
+REMINDER_TABLES = {
+    db.ASSIGNMENTS: ("AssignmentName", "assignment"),
+    db.ACTIVITIES: ("ActivityName", "activity"),
+}
+# Ids per bulk flag update
+FLAG_CHUNK_SIZE = 100
+
+
+def set_flags(table_name, flag, ids):
+    # One UPDATE ... WHERE id IN (...) per chunk instead of one request per row
+    for i in range(0, len(ids), FLAG_CHUNK_SIZE):
+        db.update_ids(table_name, ids[i : i + FLAG_CHUNK_SIZE], {flag: 1})
+
+
+class ReminderScheduler:
+    """
+    Keeps every upcoming reminder in a min-heap ordered by its exact fire time
+    (end_datetime minus the lead time) and sleeps until the next one is due.
+    New rows are picked up by polling created_at, or straight away when the scraper writes
+    rows in this process (cache.rows_written).
+    A lead time's reminder is only sent while the deadline is still further away than the
+    next shorter lead time; after that the shorter reminder covers it.
+    """
+
+    def __init__(self):
+        self.heap = []  # (fire time, sequence, reminder)
+        self.scheduled = set()  # (table, id, flag) already in the heap
+        self.sequence = itertools.count()
+        self.watermark = None  # newest created_at loaded
+        self.loaded_at = 0.0
+        self.refreshed_at = 0.0
+        self.wakeup = threading.Event()
+        metrics.gauge("reminder.scheduled", lambda: len(self.heap))
+
+    def horizon(self):
+        # Deadlines further away than this are loaded by a later full reload
+        return LEAD_TIMES[-1][0] + timedelta(seconds=2 * REMINDER_RELOAD_INTERVAL)
+
+    def load(self, incremental=False):
+        now = datetime.now(timezone.utc)
+        flags = ", ".join(flag for _, flag, _ in LEAD_TIMES)
+        # Only rows with a reminder still unsent (served by the partial index in the README)
+        unsent = ",".join(f"{flag}.is.null" for _, flag, _ in LEAD_TIMES)
+        if not incremental:
+            self.heap, self.scheduled = [], set()
+        added = 0
+        for table_name, (name_field, kind) in REMINDER_TABLES.items():
+            rows = db.upcoming_rows(
+                table_name,
+                f"id, LineID, {name_field}, end_datetime, created_at, {flags}",
+                now.isoformat(),
+                until=(now + self.horizon()).isoformat(),
+                created_after=(
+                    self.watermark.isoformat() if incremental and self.watermark else None
+                ),
+                refine=lambda query: query.or_(unsent),
+                name="reminders",
             )
-
-            line_bot_api.push_message(push_request)
-            app.logger.info(f"Successfully sent: '{push_text}'")
-    
-
-# --- Background Task Function using 'schedule' library ---
+            for row in rows:
+                added += self.add_row(table_name, name_field, kind, row, now)
+                created_at = parse_timestamp(row.get("created_at"))
+                if created_at and (not self.watermark or created_at > self.watermark):
+                    self.watermark = created_at
+        self.refreshed_at = time.time()
+        if not incremental:
+            self.loaded_at = self.refreshed_at
+        if added:
+            logging.info(f"Scheduled {added} reminders ({len(self.heap)} pending).")
+
+    def add_row(self, table_name, name_field, kind, row, now):
+        end = parse_timestamp(row["end_datetime"])
+        if end is None:
+            return 0
+        added = 0
+        for i, (lead, flag, label) in enumerate(LEAD_TIMES):
+            shorter = LEAD_TIMES[i - 1][0] if i else timedelta(0)
+            key = (table_name, row["id"], flag)
+            if row.get(flag) is not None or end - now <= shorter or key in self.scheduled:
+                continue
+            reminder = {
+                "table": table_name,
+                "id": row["id"],
+                "flag": flag,
+                "LineID": row["LineID"],
+                "name": row[name_field],
+                "kind": kind,
+                "label": label,
+                "end": end,
+                "shorter": shorter,
+            }
+            self.scheduled.add(key)
+            heapq.heappush(self.heap, (end - lead, next(self.sequence), reminder))
+            added += 1
+        return added
+
+    def pop_due(self):
+        now = datetime.now(timezone.utc)
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_time, _, reminder = heapq.heappop(self.heap)
+            if reminder["end"] - now <= reminder["shorter"]:
+                continue  # overslept past this window
+            late = (now - fire_time).total_seconds()
+            metrics.observe("reminder.fire_delay", late)
+            if late > REMINDER_LATE_GRACE:
+                reminder = dict(reminder, label=remaining_label(reminder["end"] - now))
+            due.append(reminder)
+        return due
+
+    def retry(self, reminders):
+        # Back on the heap shortly; pop_due drops them once their lead-time window has passed.
+        # Their keys stay in self.scheduled, so a load in the meantime does not add them twice
+        fire_time = datetime.now(timezone.utc) + timedelta(seconds=REMINDER_RETRY_DELAY)
+        for reminder in reminders:
+            heapq.heappush(self.heap, (fire_time, next(self.sequence), reminder))
+        metrics.incr("reminder.retried", len(reminders))
+
+    def fire(self, due):
+        # Grouped per user and multicast across users; unsent reminders stay unflagged and
+        # are tried again after REMINDER_RETRY_DELAY
+        try:
+            delivered = deliver(due)
+        except Exception as e:
+            logging.error(f"Failed to deliver {len(due)} reminders: {e}")
+            delivered = []
+        delivered_ids = {id(reminder) for reminder in delivered}
+        failed = [reminder for reminder in due if id(reminder) not in delivered_ids]
+        if failed:
+            self.retry(failed)
+        sent = {}  # (table, flag) -> ids
+        for reminder in delivered:
+            sent.setdefault((reminder["table"], reminder["flag"]), []).append(reminder["id"])
+        for (table_name, flag), ids in sent.items():
+            try:
+                set_flags(table_name, flag, ids)
+            except Exception as e:
+                logging.error(f"Failed to set {flag} on {len(ids)} rows of {table_name}: {e}")
+            metrics.incr("reminder.sent", len(ids))
+
+    def seconds_until_next(self):
+        now = time.time()
+        wait = REMINDER_REFRESH_INTERVAL - (now - self.refreshed_at)
+        if self.heap:
+            wait = min(wait, (self.heap[0][0] - datetime.now(timezone.utc)).total_seconds())
+        return max(0, wait)
+
+    def run_forever(self):
+        # Rows written by scrapes in this process (on-demand refreshes) are loaded at once
+        on_rows_written(lambda line_id: self.wakeup.set())
+        while True:
+            try:
+                woken = self.wakeup.is_set()
+                self.wakeup.clear()
+                if time.time() - self.loaded_at >= REMINDER_RELOAD_INTERVAL:
+                    self.load()
+                elif woken or time.time() - self.refreshed_at >= REMINDER_REFRESH_INTERVAL:
+                    self.load(incremental=True)
+                self.fire(self.pop_due())
+            except Exception as e:
+                logging.error(f"Reminder scheduler error: {e}")
+                time.sleep(5)
+            self.wakeup.wait(self.seconds_until_next())
+
+
+# --- Background Task Function ---
 def run_scheduled_tasks():
     """This function will be the target of our background thread."""
     print("Background task runner started.")
-    # Schedule your checker functions
-    schedule.every(3).minutes.do(assignmentchecker)
-    schedule.every(3).minutes.do(activitieschecker)
-
-    while True:
-        schedule.run_pending()
-        time.sleep(3) # Check schedule every second
+    ReminderScheduler().run_forever()
 
 # --- Function to Start Background Thread ---
 def start_reminder_thread():
@@ -136,4 +252,4 @@ if __name__ == "__main__":
     # Gunicorn will handle this in production based on your Procfile
     port = int(os.environ.get('PORT', 5000))
     print(f"Starting Flask app on host 0.0.0.0, port {port}")
-    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False) # debug=False, use_reloader=False for stability with threads
\ No newline at end of file
+    app.app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False) # debug=False, use_reloader=False for stability with threads
\ No newline at end of file
@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import db
+import metrics
+from page_scraping import create_backend, scrape_student
+from scrape_scheduler import parse_timestamp
+
+# Rows scraped less than this many seconds ago are served without a new scrape
+STALENESS_BUDGET = int(os.environ.get("SCRAPE_STALENESS_BUDGET", 600))
+# How long a query waits for its refresh before answering from the stored rows
+REFRESH_TIMEOUT = float(os.environ.get("SCRAPE_REFRESH_TIMEOUT", 15))
+# Without ASYNC_WEBHOOK the wait happens inside /callback, which LINE expects to return
+# quickly, so it is capped much lower there
+ASYNC_WEBHOOK = os.environ.get("ASYNC_WEBHOOK", "0").lower() in ("1", "true", "yes")
+SYNC_REFRESH_TIMEOUT = float(os.environ.get("SCRAPE_REFRESH_TIMEOUT_SYNC", 2))
+# Students scraped on demand at the same time
+REFRESH_WORKERS = int(os.environ.get("SCRAPE_REFRESH_WORKERS", 2))
+# Backend used for on-demand scrapes; starting a browser per query would be too slow
+REFRESH_BACKEND = os.environ.get("SCRAPE_REFRESH_BACKEND", "http")
+# After a failed on-demand scrape (e.g. a changed portal password), queries for that student
+# are answered from the stored rows for this many seconds without trying again
+FAILURE_BACKOFF = int(os.environ.get("SCRAPE_REFRESH_FAILURE_BACKOFF", 900))
+
+_lock = threading.Lock()
+_inflight = {}  # LineID -> Future of the scrape running for that student
+_fresh_at = {}  # LineID -> newest known scrape time (epoch seconds)
+_failed_until = {}  # LineID -> no on-demand scrape before this time (epoch seconds)
+_executor = None
+_executor_pid = None
+
+
+def executor():
+    # Created on first use in each process, so gunicorn workers do not share a forked pool
+    global _executor, _executor_pid
+    with _lock:
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=REFRESH_WORKERS, thread_name_prefix="scrape-on-demand"
+            )
+            _executor_pid = os.getpid()
+            _inflight.clear()
+        return _executor
+
+
+def is_fresh(line_id, now=None):
+    now = now or time.time()
+    with _lock:
+        return now - _fresh_at.get(line_id, 0) <= STALENESS_BUDGET
+
+
+def mark_fresh(line_id, scraped_at):
+    with _lock:
+        _fresh_at[line_id] = max(scraped_at, _fresh_at.get(line_id, 0))
+
+
+def backing_off(line_id, now=None):
+    now = now or time.time()
+    with _lock:
+        return now < _failed_until.get(line_id, 0)
+
+
+def mark_failed(line_id):
+    metrics.incr("scrape.on_demand.failed")
+    with _lock:
+        _failed_until[line_id] = time.time() + FAILURE_BACKOFF
+
+
+def _refresh(line_id):
+    start = time.perf_counter()
+    ok = False
+    try:
+        student = db.get_login(line_id, "LineID, StID, Ps, ScrapeHash, LastScraped, Session")
+        if student is None or not student.get("StID"):
+            # Not registered, or a professor: there are no student pages to scrape
+            return False
+        last_scraped = parse_timestamp(student.get("LastScraped"))
+        if last_scraped is not None:
+            mark_fresh(line_id, last_scraped.timestamp())
+            if is_fresh(line_id):
+                # The batch scraper got there recently enough
+                metrics.incr("scrape.on_demand.batch_fresh")
+                ok = True
+                return True
+        backend = create_backend(REFRESH_BACKEND)
+        try:
+            status = scrape_student(backend, student)
+        finally:
+            backend.close()
+        if status == "failed":
+            return False
+        mark_fresh(line_id, time.time())
+        ok = True
+        return True
+    finally:
+        if not ok:
+            mark_failed(line_id)
+        metrics.observe("scrape.on_demand.refresh_time", time.perf_counter() - start)
+        with _lock:
+            _inflight.pop(line_id, None)
+
+
+def refresh_student(line_id, timeout=None):
+    """
+    Make sure the stored rows for line_id are at most STALENESS_BUDGET seconds old,
+    scraping the student now if they are not. Concurrent calls for the same student wait
+    on one shared scrape, for at most `timeout` seconds (REFRESH_TIMEOUT, or
+    SYNC_REFRESH_TIMEOUT when the webhook is answered inline). Returns True if the rows are
+    fresh, False if the caller should answer from whatever is stored.
+    """
+    if timeout is None:
+        timeout = REFRESH_TIMEOUT if ASYNC_WEBHOOK else SYNC_REFRESH_TIMEOUT
+    if is_fresh(line_id):
+        metrics.incr("scrape.on_demand.fresh")
+        return True
+    if backing_off(line_id):
+        metrics.incr("scrape.on_demand.backoff")
+        return False
+    pool = executor()
+    with _lock:
+        future = _inflight.get(line_id)
+        if future is None:
+            future = pool.submit(_refresh, line_id)
+            _inflight[line_id] = future
+            metrics.incr("scrape.on_demand.started")
+        else:
+            metrics.incr("scrape.on_demand.coalesced")
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        # The scrape keeps running and will serve the next query
+        metrics.incr("scrape.on_demand.timeout")
+        logging.warning(f"On-demand scrape for {line_id} still running after {timeout}s")
+        return False
+    except Exception as e:
+        logging.error(f"On-demand scrape for {line_id} failed: {e}")
+        return False
@@ -0,0 +1,186 @@
+import heapq
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import metrics
+
+# Bounds on how often one student is scraped, in seconds
+MIN_INTERVAL = int(os.environ.get("SCRAPE_MIN_INTERVAL", 180))
+MAX_INTERVAL = int(os.environ.get("SCRAPE_MAX_INTERVAL", 3600))
+# A deadline closer than this keeps a student at MIN_INTERVAL
+DEADLINE_SOON_HOURS = float(os.environ.get("SCRAPE_DEADLINE_SOON_HOURS", 24))
+# Students who used the bot this recently are scraped at most 2 * MIN_INTERVAL apart
+ACTIVE_RECENT_HOURS = float(os.environ.get("SCRAPE_ACTIVE_RECENT_HOURS", 24))
+# How often "Login data" is re-read to pick up new students and LastActive
+STUDENT_REFRESH = int(os.environ.get("SCRAPE_STUDENT_REFRESH", 300))
+# Weight of the latest scrape in a student's change rate
+CHANGE_RATE_ALPHA = 0.3
+
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def next_interval(now, deadline=None, last_active=None, change_rate=1.0, failures=0):
+    """
+    Seconds until a student should be scraped again.
+    The interval shrinks from MAX_INTERVAL towards MIN_INTERVAL as the student's results
+    change more often; an upcoming deadline or recent bot use pulls it down further.
+    Failed scrapes back off exponentially instead.
+    """
+    if failures:
+        return min(MAX_INTERVAL, MIN_INTERVAL * 2 ** (failures - 1))
+    interval = MAX_INTERVAL - (MAX_INTERVAL - MIN_INTERVAL) * change_rate
+    if deadline is not None:
+        hours_left = (deadline - now).total_seconds() / 3600
+        if hours_left <= DEADLINE_SOON_HOURS:
+            interval = MIN_INTERVAL
+        elif hours_left <= 3 * DEADLINE_SOON_HOURS:
+            interval = min(interval, 4 * MIN_INTERVAL)
+    if last_active is not None:
+        hours_idle = (now - last_active).total_seconds() / 3600
+        if hours_idle <= ACTIVE_RECENT_HOURS:
+            interval = min(interval, 2 * MIN_INTERVAL)
+    return max(MIN_INTERVAL, min(MAX_INTERVAL, interval))
+
+
+class AdaptiveScheduler:
+    """
+    Scrapes each student on their own timetable instead of everyone every 3 minutes.
+    Students sit in a min-heap ordered by their next scrape time; whoever is due is scraped
+    together as one cycle and then rescheduled with next_interval().
+
+    load_students() returns "Login data" rows, run_cycle(students) returns a cycle summary
+    (see page_scraping.cycle_summary) and upcoming_deadlines(line_ids) maps LineID to the
+    nearest end_datetime.
+    """
+
+    def __init__(self, load_students, run_cycle, upcoming_deadlines):
+        self.load_students = load_students
+        self.run_cycle = run_cycle
+        self.upcoming_deadlines = upcoming_deadlines
+        self.heap = []  # (due time, LineID)
+        self.due_at = {}  # LineID -> due time of its live heap entry
+        self.students = {}  # LineID -> "Login data" row
+        self.change_rate = {}  # LineID -> moving average of "changed" results
+        self.failures = {}  # LineID -> consecutive failed scrapes
+        self.loaded_at = None
+        metrics.gauge("scrape.scheduled", lambda: len(self.due_at))
+
+    def schedule(self, line_id, due):
+        self.due_at[line_id] = due
+        heapq.heappush(self.heap, (due, line_id))
+
+    def refresh_students(self):
+        try:
+            rows = self.load_students() or []
+        except Exception as e:
+            logging.error(f"Could not reload students: {e}")
+            return
+        self.loaded_at = time.time()
+        current = {row["LineID"]: row for row in rows}
+        for line_id in current:
+            if line_id not in self.students:
+                # New students are scraped straight away
+                self.schedule(line_id, self.loaded_at)
+        for line_id in set(self.students) - set(current):
+            # Their heap entries are dropped lazily in pop_due()
+            self.due_at.pop(line_id, None)
+        self.students = current
+
+    def pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due_time, line_id = heapq.heappop(self.heap)
+            if self.due_at.get(line_id) != due_time or line_id not in self.students:
+                continue  # superseded or removed
+            del self.due_at[line_id]
+            due.append(line_id)
+        return due
+
+    def reschedule(self, line_id, status, deadline):
+        now = datetime.now(timezone.utc)
+        if status in ("failed", None):
+            # Not reached this cycle (e.g. no worker could start a browser) backs off like a
+            # failure, so a broken backend is not retried every second
+            self.failures[line_id] = self.failures.get(line_id, 0) + 1
+        else:
+            self.failures.pop(line_id, None)
+            changed = 1.0 if status == "changed" else 0.0
+            rate = self.change_rate.get(line_id, 1.0)
+            self.change_rate[line_id] = (
+                CHANGE_RATE_ALPHA * changed + (1 - CHANGE_RATE_ALPHA) * rate
+            )
+        interval = next_interval(
+            now,
+            deadline=deadline,
+            last_active=parse_timestamp(self.students[line_id].get("LastActive")),
+            change_rate=self.change_rate.get(line_id, 1.0),
+            failures=self.failures.get(line_id, 0),
+        )
+        self.schedule(line_id, time.time() + interval)
+        return interval
+
+    def run_once(self):
+        if self.loaded_at is None or time.time() - self.loaded_at >= STUDENT_REFRESH:
+            self.refresh_students()
+        due = self.pop_due(time.time())
+        if not due:
+            return None
+        metrics.incr("scrape.scheduled_scrapes", len(due))
+        try:
+            summary = self.run_cycle([self.students[line_id] for line_id in due])
+        except Exception as e:
+            # Put the due students back (backing off as for a failed scrape); pop_due already
+            # took them out of the schedule and refresh_students only adds new LineIDs
+            logging.error(f"Scrape cycle failed for {len(due)} students: {e}")
+            for line_id in due:
+                self.reschedule(line_id, "failed", None)
+            return None
+        statuses = {student_id: status for student_id, _, status in summary["timings"]}
+        try:
+            deadlines = self.upcoming_deadlines(due)
+        except Exception as e:
+            logging.warning(f"Could not read upcoming deadlines: {e}")
+            deadlines = {}
+        intervals = []
+        for line_id in due:
+            status = statuses.get(self.students[line_id]["StID"])
+            intervals.append(self.reschedule(line_id, status, deadlines.get(line_id)))
+        logging.info(
+            f"Scraped {len(due)} of {len(self.students)} students; next scrapes in "
+            f"{min(intervals) / 60:.0f}-{max(intervals) / 60:.0f} min"
+        )
+        return summary
+
+    def seconds_until_next(self):
+        while self.heap and self.due_at.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return STUDENT_REFRESH
+        return max(0, self.heap[0][0] - time.time())
+
+    def run_forever(self, max_sleep=30):
+        logging.info(
+            f"Adaptive scrape schedule: every {MIN_INTERVAL / 60:.0f}-{MAX_INTERVAL / 60:.0f} min "
+            "per student."
+        )
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Scheduled scrape failed: {e}")
+            time.sleep(max(1, min(max_sleep, self.seconds_until_next())))
@@ -0,0 +1,80 @@
+import types
+
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock for cache.py, moved forward with clock.now += seconds."""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache("test_expiry", ttl=60)
+    c.set("a", 1)
+    c.set("b", 2, ttl=120)
+    clock.now += 59
+    assert c.get("a") == 1
+    clock.now += 2
+    assert c.get("a") is None
+    assert c.get("b") == 2
+    clock.now += 60
+    assert c.get("b", "gone") == "gone"
+    assert c.stats()["size"] == 0
+
+
+def test_set_again_restarts_the_ttl(clock):
+    c = TTLCache("test_reset", ttl=60)
+    c.set("a", 1)
+    clock.now += 50
+    c.set("a", 2)
+    clock.now += 50
+    assert c.get("a") == 2
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    c = TTLCache("test_lru", maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1
+    assert c.get("c") == 3
+
+
+def test_invalidate_tag_drops_only_that_users_entries(clock):
+    c = TTLCache("test_tags", ttl=60)
+    c.set(("U1", "assignments"), "x", tags=["U1"])
+    c.set(("U1", "activities"), "y", tags=["U1"])
+    c.set(("U2", "assignments"), "z", tags=["U2"])
+    assert c.invalidate_tag("U1") == 2
+    assert c.get(("U1", "assignments")) is None
+    assert c.get(("U1", "activities")) is None
+    assert c.get(("U2", "assignments")) == "z"
+    assert c.invalidate_tag("U1") == 0
+
+
+def test_replaced_or_expired_entries_leave_their_tags(clock):
+    c = TTLCache("test_tag_cleanup", ttl=60)
+    c.set("a", 1, tags=["U1"])
+    c.set("a", 2, tags=["U2"])
+    # "a" is no longer tagged U1
+    assert c.invalidate_tag("U1") == 0
+    assert c.get("a") == 2
+    clock.now += 61
+    assert c.get("a") is None
+    assert c.invalidate_tag("U2") == 0
+
+
+def test_hit_rate(clock):
+    c = TTLCache("test_hit_rate", ttl=60)
+    c.set("a", 1)
+    c.get("a")
+    c.get("missing")
+    assert c.hit_rate() == 0.5
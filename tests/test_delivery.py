@@ -0,0 +1,112 @@
+import threading
+import types
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("linebot")
+
+import delivery
+import line_api_stub
+import messaging
+
+END = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def reminder(line_id, name, hours=24, kind="assignment"):
+    return {
+        "table": "Assignment table",
+        "id": hash((line_id, name)),
+        "flag": "flag1",
+        "LineID": line_id,
+        "name": name,
+        "kind": kind,
+        "label": "1 day",
+        "end": END + timedelta(hours=hours),
+    }
+
+
+@pytest.fixture
+def line_api(monkeypatch):
+    """line_api_stub on a free local port, with the shared LINE client pointed at it."""
+    for key in line_api_stub.STATS:
+        line_api_stub.STATS[key] = 0
+    line_api_stub.RETRY_KEYS.clear()
+    line_api_stub.ACCEPTED_KEYS.clear()
+    line_api_stub._window.update(start=0.0, count=0)
+    monkeypatch.setitem(line_api_stub.OPTIONS, "latency", 0.0)
+    monkeypatch.setitem(line_api_stub.OPTIONS, "rate_limit", 0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), line_api_stub.LineApiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("LINE_API_HOST", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("CHANNEL_ACCESS_TOKEN", "test-token")
+    monkeypatch.setitem(messaging._state, "pid", None)
+    yield line_api_stub
+    server.shutdown()
+    server.server_close()
+    messaging._state["pid"] = None
+
+
+def test_plan_groups_per_user_and_shares_identical_texts():
+    reminders = [
+        reminder("U1", "essay", hours=48),
+        reminder("U1", "quiz"),
+        reminder("U2", "lab"),
+        reminder("U3", "lab"),
+    ]
+    batches = delivery.plan(reminders)
+    assert len(batches) == 2
+    by_text = {batch["text"]: batch for batch in batches}
+    mine = next(text for text in by_text if text.startswith("You have 2 reminders"))
+    # Nearest deadline first
+    assert mine.index("quiz") < mine.index("essay")
+    assert by_text[mine]["to"] == ["U1"]
+    lab = next(batch for batch in batches if batch["text"] != mine)
+    assert lab["to"] == ["U2", "U3"]
+    assert len(lab["reminders"]) == 2
+
+
+def test_plan_splits_multicasts_at_the_limit():
+    reminders = [reminder(f"U{i}", "lab") for i in range(delivery.MULTICAST_LIMIT * 2 + 1)]
+    batches = delivery.plan(reminders)
+    assert [len(batch["to"]) for batch in batches] == [
+        delivery.MULTICAST_LIMIT,
+        delivery.MULTICAST_LIMIT,
+        1,
+    ]
+    assert sum(len(batch["reminders"]) for batch in batches) == len(reminders)
+
+
+def test_send_batch_waits_out_429_and_reuses_retry_key(line_api, monkeypatch):
+    monkeypatch.setitem(line_api.OPTIONS, "rate_limit", 1)
+    line_api._window.update(start=float("inf"), count=1)  # the next request is over the limit
+    batch = delivery.plan([reminder("U1", "quiz"), reminder("U2", "quiz")])[0]
+    sleeps = []
+
+    def reopen(delay):
+        # Instead of waiting, open a new rate-limit window
+        sleeps.append(delay)
+        line_api._window.update(start=0.0, count=0)
+
+    # Only delivery's sleeps: the stub's own time.sleep must stay real
+    monkeypatch.setattr(delivery, "time", types.SimpleNamespace(sleep=reopen))
+    assert delivery.send_batch(batch)
+    assert sleeps == [1.0]  # Retry-After from the stub
+    assert line_api.STATS["rate_limited"] == 1
+    assert line_api.STATS["multicast"] == 1
+    assert len(line_api.RETRY_KEYS) == 2
+    assert line_api.RETRY_KEYS[0] == line_api.RETRY_KEYS[1]
+
+
+def test_send_batch_treats_409_as_delivered(line_api, monkeypatch):
+    key = uuid.UUID("00000000-0000-4000-8000-000000000001")
+    monkeypatch.setattr(delivery.uuid, "uuid4", lambda: key)
+    batch = delivery.plan([reminder("U1", "quiz")])[0]
+    assert delivery.send_batch(batch)
+    # The same retry key again, as if the first response had been lost
+    assert delivery.send_batch(batch)
+    assert line_api.STATS["push"] == 1
+    assert line_api.STATS["duplicates"] == 1
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+import model_server
+from model_server import BatchingGenerator
+
+
+class FakePipeline:
+    """Echoes each prompt back in upper case and records the batches it was given."""
+
+    def __init__(self, nested=False, error=None):
+        self.batches = []
+        self.nested = nested
+        self.error = error
+
+    def __call__(self, texts, batch_size, **kwargs):
+        self.batches.append((list(texts), kwargs))
+        if self.error:
+            raise self.error
+        outputs = [{"generated_text": f"{text.upper()}{kwargs.get('suffix', '')}"} for text in texts]
+        return [[output] for output in outputs] if self.nested else outputs
+
+
+def generate_all(batcher, prompts, **kwargs):
+    # One thread per prompt, all waiting on the batcher at the same time
+    results = {}
+    errors = {}
+
+    def run(prompt):
+        try:
+            results[prompt] = batcher.generate(prompt, **kwargs)
+        except Exception as e:
+            errors[prompt] = e
+
+    threads = [threading.Thread(target=run, args=(prompt,)) for prompt in prompts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+@pytest.mark.parametrize("nested", [False, True])
+def test_each_caller_gets_its_own_result(monkeypatch, nested):
+    pipeline = FakePipeline(nested=nested)
+    monkeypatch.setattr(model_server, "get_generator", lambda: pipeline)
+    batcher = BatchingGenerator(max_batch_size=4, max_wait_ms=200)
+    prompts = [f"prompt {i}" for i in range(8)]
+    results, errors = generate_all(batcher, prompts)
+    assert not errors
+    assert results == {prompt: prompt.upper() for prompt in prompts}
+    # Callers were batched together, never more than max_batch_size at once
+    assert len(pipeline.batches) < len(prompts)
+    assert all(len(texts) <= 4 for texts, _ in pipeline.batches)
+
+
+def test_prompts_are_only_batched_with_the_same_kwargs(monkeypatch):
+    pipeline = FakePipeline()
+    monkeypatch.setattr(model_server, "get_generator", lambda: pipeline)
+    batcher = BatchingGenerator(max_batch_size=8, max_wait_ms=200)
+    results = {}
+
+    def run(prompt, suffix):
+        results[prompt] = batcher.generate(prompt, suffix=suffix)
+
+    threads = [
+        threading.Thread(target=run, args=args)
+        for args in [("a", "!"), ("b", "?"), ("c", "!"), ("d", "?")]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == {"a": "A!", "b": "B?", "c": "C!", "d": "D?"}
+    for texts, kwargs in pipeline.batches:
+        assert {text in ("a", "c") for text in texts} == {kwargs["suffix"] == "!"}
+
+
+def test_a_failed_batch_raises_in_every_caller(monkeypatch):
+    pipeline = FakePipeline(error=RuntimeError("out of memory"))
+    monkeypatch.setattr(model_server, "get_generator", lambda: pipeline)
+    batcher = BatchingGenerator(max_batch_size=4, max_wait_ms=100)
+    results, errors = generate_all(batcher, ["a", "b", "c"])
+    assert not results
+    assert set(errors) == {"a", "b", "c"}
+    assert all(isinstance(e, RuntimeError) for e in errors.values())
@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+# page_scraping needs the scraper's dependencies and an FKEY at import time
+pytest.importorskip("selenium")
+pytest.importorskip("webdriver_manager")
+pytest.importorskip("schedule")
+pytest.importorskip("supabase")
+fernet = pytest.importorskip("cryptography.fernet")
+os.environ.setdefault("FKEY", fernet.Fernet.generate_key().decode())
+
+import page_scraping
+
+ASSIGNMENTS = [("Essay", "2025/06/13 08:00 ~ 2025/06/13 23:59")]
+ACTIVITIES = [("Midterm", "2025.05.29(四) 下午 06:00")]
+
+
+@pytest.fixture
+def login_updates(monkeypatch):
+    """Updates written to "Login data", with the scraper's in-memory state reset."""
+    updates = []
+    monkeypatch.setattr(page_scraping, "_scrape_hashes", {})
+    monkeypatch.setattr(page_scraping, "_last_scraped", {})
+    monkeypatch.setattr(page_scraping, "rows_written", lambda line_id: None)
+    monkeypatch.setattr(
+        page_scraping.db, "update_login", lambda line_id, values: updates.append(values)
+    )
+    return updates
+
+
+def student(**row):
+    return {"LineID": "U1", "StID": "s1234567", **row}
+
+
+def test_failed_page_is_never_unchanged(login_updates):
+    assert page_scraping.check_unchanged(student(), None, ACTIVITIES) == (None, False)
+    assert page_scraping.check_unchanged(student(), ASSIGNMENTS, None) == (None, False)
+
+
+def test_results_matching_the_stored_hash_are_unchanged(login_updates):
+    digest = page_scraping.content_hash(ASSIGNMENTS, ACTIVITIES)
+    assert page_scraping.check_unchanged(student(ScrapeHash=digest), ASSIGNMENTS, ACTIVITIES) == (
+        digest,
+        True,
+    )
+    changed = ASSIGNMENTS + [("Lab", "2025/06/20 08:00 ~ 2025/06/20 23:59")]
+    new_digest, unchanged = page_scraping.check_unchanged(
+        student(ScrapeHash=digest), changed, ACTIVITIES
+    )
+    assert not unchanged
+    assert new_digest != digest
+
+
+def test_recorded_hash_is_remembered_and_written(login_updates):
+    digest, unchanged = page_scraping.check_unchanged(
+        student(ScrapeHash="old"), ASSIGNMENTS, ACTIVITIES
+    )
+    assert not unchanged
+    page_scraping.record_scrape("U1", digest)
+    assert login_updates[-1]["ScrapeHash"] == digest
+    assert "LastScraped" in login_updates[-1]
+    # The "Login data" row read before the scrape still has the old hash
+    assert page_scraping.check_unchanged(student(ScrapeHash="old"), ASSIGNMENTS, ACTIVITIES)[1]
+
+
+def test_cleared_hash_forces_a_write(login_updates):
+    digest, _ = page_scraping.check_unchanged(student(), ASSIGNMENTS, ACTIVITIES)
+    page_scraping.record_scrape("U1", digest)
+    assert page_scraping.check_unchanged(student(ScrapeHash=None), ASSIGNMENTS, ACTIVITIES) == (
+        digest,
+        False,
+    )
+    assert page_scraping.stored_hash(student()) is None
+
+
+def test_hash_is_only_recorded_when_every_row_was_written(login_updates, monkeypatch):
+    monkeypatch.setattr(page_scraping, "write_rows", lambda *args: False)
+    digest, _ = page_scraping.check_unchanged(student(), ASSIGNMENTS, ACTIVITIES)
+    page_scraping.store_student("U1", "s1234567", ASSIGNMENTS, ACTIVITIES, digest)
+    assert all("ScrapeHash" not in update for update in login_updates)
+    assert page_scraping.stored_hash(student()) is None
+    monkeypatch.setattr(page_scraping, "write_rows", lambda *args: True)
+    page_scraping.store_student("U1", "s1234567", ASSIGNMENTS, ACTIVITIES, digest)
+    assert login_updates[-1]["ScrapeHash"] == digest
+    assert page_scraping.check_unchanged(student(), ASSIGNMENTS, ACTIVITIES)[1]
+
+
+@pytest.fixture
+def sessions(monkeypatch, login_updates):
+    """Saved portal sessions, starting empty; returns the "Login data" updates."""
+    monkeypatch.setattr(page_scraping, "_sessions", {})
+    return login_updates
+
+
+def test_saved_session_is_loaded_back(sessions):
+    cookies = {"ASP.NET_SessionId": "abc"}
+    page_scraping.save_session("U1", cookies)
+    assert page_scraping.load_session(student()) == cookies
+    # Stored encrypted on "Login data".Session
+    token = sessions[-1]["Session"]
+    assert b"abc" in page_scraping.cypher.decrypt(token.encode())
+    # Another process reads it from the row
+    page_scraping._sessions.clear()
+    assert page_scraping.load_session(student(Session=token)) == cookies
+
+
+def test_session_expires_after_max_age(sessions, monkeypatch):
+    page_scraping.save_session("U1", {"ASP.NET_SessionId": "abc"})
+    token = sessions[-1]["Session"]
+    now = page_scraping.time.time()
+    monkeypatch.setattr(
+        page_scraping.time, "time", lambda: now + page_scraping.SESSION_MAX_AGE + 1
+    )
+    assert page_scraping.load_session(student()) is None
+    page_scraping._sessions.clear()
+    assert page_scraping.load_session(student(Session=token)) is None
+
+
+def test_resumed_session_stays_alive(sessions, monkeypatch):
+    cookies = {"ASP.NET_SessionId": "abc"}
+    page_scraping.save_session("U1", cookies)
+    now = page_scraping.time.time()
+    later = now + page_scraping.SESSION_MAX_AGE - 10
+    monkeypatch.setattr(page_scraping.time, "time", lambda: later)
+    page_scraping.session_resumed("U1", 0.1)
+    # Counted from the last use, not from when it was saved
+    monkeypatch.setattr(page_scraping.time, "time", lambda: later + 60)
+    assert page_scraping.load_session(student()) == cookies
+
+
+def test_forgotten_or_unreadable_sessions_are_not_loaded(sessions):
+    page_scraping.save_session("U1", {"ASP.NET_SessionId": "abc"})
+    token = sessions[-1]["Session"]
+    page_scraping.forget_session("U1")
+    # Not even the token still on the row read before the session was dropped
+    assert page_scraping.load_session(student(Session=token)) is None
+    page_scraping._sessions.clear()
+    assert page_scraping.load_session(student(Session="not a token")) is None
+    assert page_scraping.load_session(student(Session=None)) is None
@@ -0,0 +1,35 @@
+from portal_dates import date_fields, date_info
+
+
+def test_assignment_range():
+    fields = date_fields("2025/05/14 08:17 ~ 2025/06/13 23:59", "assignment")
+    assert fields["end_datetime"] == "2025-06-13T23:59:00+08:00"
+    assert date_info(fields, "assignment") == {
+        "day": "Friday",
+        "date": "2025-06-13",
+        "time": "23:59",
+    }
+
+
+def test_activity_range():
+    fields = date_fields("2025.05.29(四) 下午 06:00 ~ 2025.05.29(四) 下午 08:00", "activity")
+    assert fields["start_datetime"] == "2025-05-29T18:00:00+08:00"
+    assert fields["end_datetime"] == "2025-05-29T20:00:00+08:00"
+    assert date_info(fields, "activity") == {
+        "day": "Thursday",
+        "date": "2025-05-29",
+        "start_time": "18:00",
+        "end_time": "20:00",
+    }
+
+
+def test_activity_single_time():
+    # No "~": the one time is both the start and the end
+    fields = date_fields("2025.05.29(四) 下午 06:00", "activity")
+    assert fields["start_datetime"] == fields["end_datetime"] == "2025-05-29T18:00:00+08:00"
+    assert fields["display_date"] == "2025-05-29"
+    assert fields["start_time"] == fields["end_time"] == "18:00"
+
+
+def test_unparseable():
+    assert set(date_fields("TBA", "activity").values()) == {None}
@@ -0,0 +1,74 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import portal_fixture_server
+import portal_http
+from portal_http import PortalSession, parse_activities_html, parse_assignments_html
+
+USER, PASSWORD = "s1234567", "password"
+
+
+@pytest.fixture
+def portal(monkeypatch):
+    """The fixture portal on a free local port, with portal_http pointed at it."""
+    portal_fixture_server.USERS[USER] = PASSWORD
+    server = ThreadingHTTPServer(("127.0.0.1", 0), portal_fixture_server.PortalHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}{portal_fixture_server.PREFIX}"
+    monkeypatch.setattr(portal_http, "LOGIN_URL", base + "Login.aspx")
+    monkeypatch.setattr(portal_http, "MAIN_URL", base + "Default.aspx")
+    yield base
+    server.shutdown()
+    server.server_close()
+
+
+def test_login(portal):
+    session = PortalSession()
+    try:
+        assert session.login(USER, PASSWORD)
+    finally:
+        session.close()
+
+
+def test_wrong_password(portal):
+    session = PortalSession()
+    try:
+        assert not session.login(USER, "wrong")
+    finally:
+        session.close()
+
+
+def test_assignments_and_activities(portal):
+    session = PortalSession()
+    try:
+        assert session.login(USER, PASSWORD)
+        assignments = parse_assignments_html(session.assignments_html())
+        activities = parse_activities_html(session.activities_html())
+    finally:
+        session.close()
+    assert [title for title, _ in assignments] == [
+        title for title, _ in portal_fixture_server.assignments()
+    ]
+    assert all("~" in time_range for _, time_range in assignments)
+    assert [subject for subject, _ in activities] == [
+        subject for subject, _ in portal_fixture_server.activities()
+    ]
+    assert all("~" in date for _, date in activities)
+
+
+def test_resume(portal):
+    session = PortalSession()
+    try:
+        assert session.login(USER, PASSWORD)
+        cookies = session.cookies()
+    finally:
+        session.close()
+    resumed = PortalSession()
+    try:
+        assert resumed.resume(cookies)
+        assert parse_assignments_html(resumed.assignments_html())
+    finally:
+        resumed.close()
@@ -0,0 +1,95 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from scrape_scheduler import (
+    DEADLINE_SOON_HOURS,
+    MAX_INTERVAL,
+    MIN_INTERVAL,
+    AdaptiveScheduler,
+    next_interval,
+    parse_timestamp,
+)
+
+NOW = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_interval_follows_change_rate():
+    assert next_interval(NOW, change_rate=0.0) == MAX_INTERVAL
+    assert next_interval(NOW, change_rate=1.0) == MIN_INTERVAL
+    assert MIN_INTERVAL < next_interval(NOW, change_rate=0.5) < MAX_INTERVAL
+
+
+def test_close_deadline_and_recent_use_shorten_the_interval():
+    soon = NOW + timedelta(hours=DEADLINE_SOON_HOURS / 2)
+    assert next_interval(NOW, deadline=soon, change_rate=0.0) == MIN_INTERVAL
+    later = NOW + timedelta(hours=2 * DEADLINE_SOON_HOURS)
+    assert next_interval(NOW, deadline=later, change_rate=0.0) == min(
+        MAX_INTERVAL, 4 * MIN_INTERVAL
+    )
+    far = NOW + timedelta(days=30)
+    assert next_interval(NOW, deadline=far, change_rate=0.0) == MAX_INTERVAL
+    active = NOW - timedelta(minutes=5)
+    assert next_interval(NOW, last_active=active, change_rate=0.0) == min(
+        MAX_INTERVAL, 2 * MIN_INTERVAL
+    )
+
+
+def test_failures_back_off_exponentially_up_to_the_max():
+    intervals = [next_interval(NOW, failures=n) for n in range(1, 20)]
+    assert intervals[0] == MIN_INTERVAL
+    assert intervals[1] == min(MAX_INTERVAL, 2 * MIN_INTERVAL)
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == MAX_INTERVAL
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("2025-06-01T12:00:00Z") == NOW
+    assert parse_timestamp("2025-06-01T12:00:00") == NOW
+    assert parse_timestamp("not a date") is None
+    assert parse_timestamp(None) is None
+
+
+@pytest.fixture
+def scheduler():
+    students = [{"LineID": "U1", "StID": "s1"}, {"LineID": "U2", "StID": "s2"}]
+    scheduler = AdaptiveScheduler(lambda: students, None, lambda line_ids: {})
+    scheduler.refresh_students()
+    return scheduler
+
+
+def test_unchanged_results_stretch_the_interval(scheduler):
+    first = scheduler.reschedule("U1", "changed", None)
+    second = scheduler.reschedule("U1", "unchanged", None)
+    third = scheduler.reschedule("U1", "unchanged", None)
+    assert first == MIN_INTERVAL
+    assert first < second < third <= MAX_INTERVAL
+
+
+def test_failed_and_unreached_students_back_off(scheduler):
+    assert scheduler.reschedule("U1", "failed", None) == MIN_INTERVAL
+    # Not reached (e.g. no browser could start) counts as another failure, never interval 0
+    assert scheduler.reschedule("U1", None, None) == min(MAX_INTERVAL, 2 * MIN_INTERVAL)
+    assert scheduler.reschedule("U2", None, None) == MIN_INTERVAL
+    # A successful scrape resets the backoff
+    scheduler.reschedule("U1", "changed", None)
+    assert scheduler.failures.get("U1") is None
+
+
+def test_reschedule_replaces_the_due_time(scheduler):
+    assert sorted(scheduler.pop_due(time.time())) == ["U1", "U2"]
+    interval = scheduler.reschedule("U1", "changed", None)
+    assert scheduler.pop_due(time.time()) == []
+    assert scheduler.pop_due(time.time() + interval + 1) == ["U1"]
+
+
+def test_run_cycle_exception_reschedules_everyone_due(scheduler):
+    def broken_cycle(students):
+        raise RuntimeError("no workers")
+
+    scheduler.run_cycle = broken_cycle
+    assert scheduler.run_once() is None
+    assert set(scheduler.due_at) == {"U1", "U2"}
+    assert all(due > time.time() for due in scheduler.due_at.values())
+    assert scheduler.failures == {"U1": 1, "U2": 1}
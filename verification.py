@@ -0,0 +1,79 @@
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+import metrics
+from portal_http import LOGIN_URL, PortalSession
+
+# Checks portal credentials entered while registering.
+# "selenium" starts a browser; "http" posts the login form over a pooled, pre-warmed connection
+VERIFY_BACKEND = os.getenv("VERIFY_BACKEND", "selenium")
+if VERIFY_BACKEND == "selenium":
+    # Only the browser check needs Selenium (and page_scraping's FKEY)
+    from page_scraping import attempt_login, initialize_driver
+# Registrations verified at the same time per bot process
+VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", 2))
+
+_lock = threading.Lock()
+_state = {"pid": None, "transport": None}
+
+
+def transport():
+    # One keep-alive pool per process, shared by every verification
+    with _lock:
+        if _state["pid"] != os.getpid():
+            _state.update(
+                pid=os.getpid(),
+                transport=httpx.HTTPTransport(
+                    limits=httpx.Limits(
+                        max_connections=VERIFY_WORKERS,
+                        max_keepalive_connections=VERIFY_WORKERS,
+                    ),
+                    retries=1,
+                ),
+            )
+        return _state["transport"]
+
+
+def warm():
+    """
+    Open a connection to the portal in the background, so the login a few messages later
+    skips the TCP/TLS handshake. Called when a user starts registering.
+    """
+    if VERIFY_BACKEND != "http":
+        return
+
+    def run():
+        start = time.perf_counter()
+        try:
+            PortalSession(transport=transport()).client.get(LOGIN_URL)
+            metrics.observe("registration.warm_time", time.perf_counter() - start)
+        except Exception as e:
+            logging.warning(f"Could not warm portal connection: {e}")
+
+    threading.Thread(target=run, name="verify-warm", daemon=True).start()
+
+
+def check_credentials(portal_id, password):
+    """Log in to the portal with the given ID and password. True if the portal accepts them."""
+    start = time.perf_counter()
+    if VERIFY_BACKEND == "selenium":
+        driver = initialize_driver()
+        try:
+            accepted = attempt_login(driver, portal_id, password)
+        finally:
+            driver.quit()
+    else:
+        # The session is not closed: that would close the transport shared with other checks
+        accepted = PortalSession(transport=transport()).login(portal_id, password)
+    elapsed = time.perf_counter() - start
+    metrics.observe("registration.verify_time", elapsed)
+    metrics.incr("registration.verified" if accepted else "registration.rejected")
+    logging.info(
+        f"Verified {portal_id} with {VERIFY_BACKEND}: "
+        f"{'accepted' if accepted else 'rejected'} in {elapsed:.1f}s"
+    )
+    return accepted